@@ -12,6 +12,7 @@ from .assign import assign
 from ..progress.cli_progress import CLIProgress
 from ..utils import parse_bytes_str, s2t
 from ..exception import HandleError
+from .. import ffmpeg
 
 
 def handle_help(ctx: click.Context, param: typing.Union[click.Option, click.Parameter], value: typing.Any, ) -> None:
@@ -37,6 +38,12 @@ def handle_debug(ctx: click.Context, param: typing.Union[click.Option, click.Par
     logger.debug("Debug on, more information will be shown")
 
 
+def handle_ffmpeg_con(ctx: click.Context, param: typing.Union[click.Option, click.Parameter], value: typing.Any, ):
+    if value is None or ctx.resilient_parsing:
+        return
+    ffmpeg.pool.max_workers = value
+
+
 def print_help():
     console = rich.console.Console()
     console.print(f"\n[bold]bilix {__version__}", justify="center")
@@ -92,6 +99,19 @@ def print_help():
         '[dark_cyan]int',
         "控制每个媒体的分段并发数，默认10",
     )
+    table.add_row(
+        "-fc --ffmpeg-con",
+        '[dark_cyan]int',
+        "控制最大同时运行的ffmpeg进程数（合并优先于剪辑），默认2",
+    )
+    table.add_row(
+        "--adaptive", '',
+        "根据吞吐量和错误自动调整视频及分段并发数（AIMD），此时-vc -pc作为初始值",
+    )
+    table.add_row(
+        "--stream-mux", '',
+        "边下载边通过管道将视频和音频交给ffmpeg合并，完成后立即可用且不留中间文件（不支持断点续传），仅bilibili，youtube生效",
+    )
     table.add_row(
         '--cookie',
         '[dark_cyan]str',
@@ -165,6 +185,14 @@ def print_help():
         "-tr --time-range", '[dark_cyan]str',
         r'下载视频的时间范围，格式如 h:m:s-h:m:s 或 s-s，默认无，仅get_video时生效',
     )
+    table.add_row(
+        "--duration", '[dark_cyan]str',
+        r'直播录制时长，格式如 h:m:s 或 s，默认录制到直播结束，仅live时生效',
+    )
+    table.add_row(
+        "--rotate", '[dark_cyan]str',
+        r'直播录制分段时长，格式如 h:m:s 或 s，每段保存为以开始时间命名的文件，默认不分段，仅live时生效',
+    )
     table.add_row("-h --help", '', "帮助信息")
     table.add_row("-v --version", '', "版本信息")
     table.add_row("--debug", '', "显示debug信息")
@@ -201,6 +229,14 @@ class BasedTimeRange(click.ParamType):
         return start_time, end_time
 
 
+class BasedSeconds(click.ParamType):
+    name = "seconds"
+
+    def convert(self, value, param, ctx):
+        if value is not None:
+            return s2t(value)
+
+
 @click.command(add_help_option=False)
 @click.argument("method", type=str)
 @click.argument("keys", type=str, nargs=-1, required=True)
@@ -232,6 +268,18 @@ class BasedTimeRange(click.ParamType):
     type=int,
     default=10,
 )
+@click.option(
+    '--adaptive',
+    'adaptive',
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    '--stream-mux',
+    'stream_mux',
+    is_flag=True,
+    default=False,
+)
 @click.option(
     '--cookie',
     'cookie',
@@ -337,6 +385,25 @@ class BasedTimeRange(click.ParamType):
     type=BasedTimeRange(),
     default=None,
 )
+@click.option(
+    '--duration',
+    'duration',
+    type=BasedSeconds(),
+    default=None,
+)
+@click.option(
+    '--rotate',
+    'rotate',
+    type=BasedSeconds(),
+    default=None,
+)
+@click.option(
+    '--ffmpeg-con',
+    '-fc',
+    type=int,
+    expose_value=False,
+    callback=handle_ffmpeg_con,
+)
 @click.option(
     '-h',
     "--help",
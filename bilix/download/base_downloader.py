@@ -4,7 +4,7 @@ import logging
 import re
 import time
 from functools import wraps
-from typing import Union, Optional, Tuple
+from typing import Union, Optional, Tuple, Sequence, Iterable
 from contextlib import asynccontextmanager
 from urllib.parse import urlparse
 import aiofiles
@@ -13,8 +13,15 @@ import httpx
 from bilix.cli.assign import auto_assemble
 from bilix.log import logger as dft_logger
 from bilix.download.utils import req_retry, path_check
+from bilix.download.mirror import Mirrors
+from bilix.download.concurrency import AIMDController
+from bilix.download.rate_limit import TokenBucket
+from bilix.download.writer import DiskWriter
+from bilix.download.hedge import HedgeStats
+from bilix.download.client_pool import get_client, SharedTransport
 from bilix.progress.abc import Progress
 from bilix.progress.cli_progress import CLIProgress
+from bilix.progress.account import ProgressAccount
 from bilix.exception import HandleMethodError
 from pathlib import Path, PurePath
 
@@ -81,6 +88,9 @@ class BaseDownloaderMeta(type):
 class BaseDownloader(metaclass=BaseDownloaderMeta):
     pattern: re.Pattern = None
     cookie_domain: str = ""
+    # a request is hedged when it's hedge_ratio times slower than average streams and lasts hedge_delay seconds
+    hedge_ratio: float = 3.
+    hedge_delay: float = 2.
     _cli_info: dict
     _cli_map: dict
 
@@ -89,40 +99,100 @@ class BaseDownloader(metaclass=BaseDownloaderMeta):
             *,
             client: httpx.AsyncClient = None,
             browser: str = None,
-            speed_limit: Union[float, int] = None,
+            speed_limit: Union[float, int, TokenBucket] = None,
             stream_retry: int = 5,
             progress: Progress = None,
             logger: logging.Logger = None,
+            adaptive: bool = False,
     ):
         """
 
         :param client: client used for http request
         :param browser: load cookies from which browser
-        :param speed_limit: global download rate for the downloader, should be a number (Byte/s unit)
+        :param speed_limit: global download rate for the downloader, should be a number (Byte/s unit),
+            or a TokenBucket shared with other downloaders
         :param progress: progress obj
+        :param adaptive: adjust concurrency by throughput and errors (AIMD), given concurrency is used as initial
         """
         # use cli progress by default
         self.progress = progress or CLIProgress()
         self.logger = logger or dft_logger
-        self.client = client if client else httpx.AsyncClient(headers={'user-agent': 'PostmanRuntime/7.29.0'})
+        self.client = client if client else get_client(headers={'user-agent': 'PostmanRuntime/7.29.0'})
         if browser:  # load cookies from browser, may need auth
             self.update_cookies_from_browser(browser)
-        assert speed_limit is None or speed_limit > 0
-        self.speed_limit = speed_limit
+        if isinstance(speed_limit, TokenBucket):
+            self.rate_limiter = speed_limit
+        else:
+            assert speed_limit is None or speed_limit > 0
+            self.rate_limiter = TokenBucket(speed_limit) if speed_limit else None
+        self.speed_limit = self.rate_limiter.rate if self.rate_limiter else None
         self.stream_retry = stream_retry
+        # scores of backup urls
+        self.mirrors = Mirrors()
+        # adaptive concurrency controller, levels are registered by subclass
+        self.controller = AIMDController() if adaptive else None
+        # counters of hedged requests for straggling ranges and segments
+        self.hedge_stats = HedgeStats()
+        # stream workers hand received buffers to dedicated writer threads
+        self.writer = DiskWriter()
+        # received bytes are accounted in batch, then flushed to progress and controller
+        self._account = ProgressAccount(self.progress, feed=self.controller.feed if self.controller else None)
         # active stream number
         self._stream_num = 0
+        self._prewarm_tasks = {}  # origin -> task
 
     async def __aenter__(self):
         await self.client.__aenter__()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._cancel_prewarm()
         await self.client.__aexit__(exc_type, exc_val, exc_tb)
+        await self.writer.aclose()
+        self._log_hedge_stats()
 
     async def aclose(self):
         """Close transport and proxies for httpx client"""
+        self._cancel_prewarm()
         await self.client.aclose()
+        await self.writer.aclose()
+        self._log_hedge_stats()
+
+    def _prewarm(self, urls: Iterable[str], max_hosts: int = 4):
+        """
+        resolve and connect (TLS) to media hosts in background as soon as media urls are known,
+        so that first byte latency overlaps with metadata work. connections are kept by the pool.
+
+        :param urls: media urls, hosts are warmed in order
+        :param max_hosts: max number of hosts to warm
+        """
+        origins = {}
+        for url in urls:
+            u = urlparse(str(url))
+            origins.setdefault(f"{u.scheme}://{u.netloc}", str(url))
+        transport = getattr(self.client, '_transport', None)
+        for origin, url in list(origins.items())[:max_hosts]:
+            # skip hosts being warmed, or already connected in the shared pool (batch of videos on the same host)
+            if origin in self._prewarm_tasks or \
+                    (isinstance(transport, SharedTransport) and transport.has_connection(url)):
+                continue
+            task = self._prewarm_tasks[origin] = asyncio.ensure_future(self._warm(url))
+            task.add_done_callback(lambda _, o=origin: self._prewarm_tasks.pop(o, None))
+
+    async def _warm(self, url: str):
+        try:
+            # status does not matter, the connection is returned to the pool after response
+            await self.client.head(url, timeout=5.)
+        except httpx.HTTPError as e:
+            self.logger.debug(f"prewarm {urlparse(url).netloc} failed: {e.__class__.__name__} {e}")
+
+    def _cancel_prewarm(self):
+        for task in self._prewarm_tasks.values():
+            task.cancel()
+
+    def _log_hedge_stats(self):
+        if self.hedge_stats.hedged:
+            self.logger.debug(f"STREAM hedge {self.hedge_stats}")
 
     async def get_static(self, url: str, path: Union[str, Path], convert_func=None) -> Path:
         """
@@ -162,6 +232,8 @@ class BaseDownloader(metaclass=BaseDownloaderMeta):
         try:
             yield
         except httpx.HTTPStatusError as e:
+            if self.controller and e.response.status_code in (403, 429):
+                self.controller.error()
             if e.response.status_code == 403:
                 self.logger.warning(f"STREAM slowing down since 403 forbidden {e}")
                 await asyncio.sleep(10. * (times + 1))
@@ -172,6 +244,8 @@ class BaseDownloader(metaclass=BaseDownloaderMeta):
         except httpx.TransportError as e:
             msg = f'STREAM {e.__class__.__name__} 异常可能由于网络条件不佳或并发数过大导致，若重复出现请考虑降低并发数'
             self.logger.warning(msg) if times > 2 else self.logger.debug(msg)
+            if self.controller:
+                self.controller.error()
             await asyncio.sleep(.1 * (times + 1))
             raise
         except Exception as e:
@@ -185,6 +259,15 @@ class BaseDownloader(metaclass=BaseDownloaderMeta):
         """current activate network stream number"""
         return self._stream_num
 
+    @property
+    def speed(self) -> float:
+        """current aggregate download speed (Byte/s)"""
+        return self._account.speed
+
+    def _expected_speed(self, urls: Sequence[str]) -> float:
+        """expected speed (Byte/s) of a stream, by measured speed of the mirrors or current average of streams"""
+        return max([self.mirrors.stat(url).speed or 0. for url in urls] + [self.speed / max(self._stream_num, 1)])
+
     @property
     def chunk_size(self) -> Optional[int]:
         if self.speed_limit and self.speed_limit < 1e5:  # 1e5 limit bound
@@ -193,12 +276,15 @@ class BaseDownloader(metaclass=BaseDownloaderMeta):
         # default to None setup
         return None
 
-    async def _check_speed(self, content_size):
-        if self.speed_limit and (cur_speed := self.progress.active_speed) > self.speed_limit:
-            t_tgt = content_size / self.speed_limit * self.stream_num
-            t_real = content_size / cur_speed
-            t = t_tgt - t_real
-            await asyncio.sleep(t)
+    def _concurrency_sema(self, name: str, value: Union[int, asyncio.Semaphore]):
+        """semaphore for a concurrency level, follow the level of controller when adaptive"""
+        if not isinstance(value, int):  # semaphore shared by user
+            return value
+        if self.controller is None:
+            return asyncio.Semaphore(value)
+        if name not in self.controller.levels:
+            self.controller.add_level(name, value)
+        return self.controller.semaphore(name)
 
     def update_cookies_from_browser(self, browser: str):
         try:
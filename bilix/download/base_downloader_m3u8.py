@@ -1,24 +1,112 @@
 import asyncio
+import hashlib
+import re
+import shutil
+import time
 import uuid
 from pathlib import Path, PurePath
-from typing import Tuple, Union
+from typing import Tuple, Union, Dict, List, Sequence, Optional
 from urllib.parse import urlparse
-import aiofiles
 import httpx
 import os
 import m3u8
 from Crypto.Cipher import AES
 from m3u8 import Segment
 from bilix.download.base_downloader import BaseDownloader
-from bilix.download.utils import path_check, merge_files
+from bilix.download.utils import path_check, append_file
+from bilix.download.writer import OrderedWriter
+from bilix.download.journal import Journal
+from bilix.download.hedge import hedged
+from bilix.download.estimate import SizeEstimate, SizeEstimator
+from bilix.download.key_cache import KeyCache
+from bilix.download.ts import TS_PACKET_SIZE, TSJoiner
+from bilix.download.time_index import TimeIndex
 from bilix import ffmpeg
 from .utils import req_retry
 
-__all__ = ['BaseDownloaderM3u8']
+__all__ = ['BaseDownloaderM3u8', 'SegmentDecryptor', 'choose_variant']
+
+
+class SegmentDecryptor:
+    """
+    AES-128 CBC decryption of a segment fed chunk by chunk while downloading.
+    Whole blocks are decrypted as they arrive (the cipher carries the chaining IV between calls),
+    the last block is held back until finalize to strip the PKCS7 padding.
+    """
+    block_size = AES.block_size
+
+    def __init__(self, key: bytes, iv: bytes):
+        self._cipher = AES.new(key, AES.MODE_CBC, iv)
+        self._pending = bytearray()
+
+    def update(self, data: bytes) -> bytes:
+        self._pending.extend(data)
+        # keep at least one byte so that the final block is never decrypted before finalize
+        n = (len(self._pending) - 1) // self.block_size * self.block_size
+        if n <= 0:
+            return b''
+        out = self._cipher.decrypt(memoryview(self._pending)[:n])
+        del self._pending[:n]
+        return out
+
+    def finalize(self) -> bytes:
+        if len(self._pending) % self.block_size:
+            raise ValueError(f"encrypted segment is not aligned to {self.block_size} bytes block")
+        out = self._cipher.decrypt(self._pending) if self._pending else b''
+        self._pending.clear()
+        # strip PKCS7 padding, leave data untouched if it's not padded
+        if out and 0 < (pad := out[-1]) <= self.block_size and out[-pad:] == bytes([pad]) * pad:
+            out = out[:-pad]
+        return out
+
+
+def choose_variant(playlists: Sequence[m3u8.Playlist], quality: Union[int, str] = 0,
+                   max_bandwidth: int = None) -> m3u8.Playlist:
+    """
+    choose a variant stream of master playlist
+
+    :param playlists: variant streams
+    :param quality: relative choice by bandwidth (0 is the highest, 1 the second...),
+        or resolution such as '720', '1080p', '4k', the variant with the closest height is chosen
+    :param max_bandwidth: bits per second, variants above it are excluded, the lowest one is kept if none fits
+    :return:
+    """
+    def bandwidth(p: m3u8.Playlist) -> int:
+        return p.stream_info.average_bandwidth or p.stream_info.bandwidth or 0
+
+    def height(p: m3u8.Playlist) -> int:
+        return p.stream_info.resolution[1] if p.stream_info.resolution else 0
+
+    variants = sorted(playlists, key=lambda p: (bandwidth(p), height(p)), reverse=True)
+    if max_bandwidth:
+        variants = [p for p in variants if bandwidth(p) <= max_bandwidth] or variants[-1:]
+    if isinstance(quality, int):
+        return variants[min(quality, len(variants) - 1)]
+    q = quality.lower()
+    if q in ('4k', '2k'):
+        target = 2160 if q == '4k' else 1440
+    elif m := re.match(r'(\d+)p?', q):
+        target = int(m.group(1))
+    else:
+        raise ValueError(f"invalid m3u8 quality: {quality}")
+    # min is stable, so the higher bandwidth one wins a tie
+    return min(variants, key=lambda p: abs(height(p) - target))
+
+
+def _range_headers(rng: Optional[Tuple[int, int]]) -> Optional[Dict[str, str]]:
+    return {'Range': f'bytes={rng[0]}-{rng[1] - 1}'} if rng else None
 
 
 class BaseDownloaderM3u8(BaseDownloader):
     """Base Async http m3u8 Downloader"""
+    # encrypted bytes are decrypted in executor once this many are received, smaller tails in event loop
+    decrypt_batch: int = 1024 * 1024
+    # max bytes of one request merged from contiguous EXT-X-BYTERANGE segments
+    byterange_coalesce: int = 16 * 1024 * 1024
+    # number of segments probed by HEAD to estimate the total size
+    size_samples: int = 5
+    # TS playlists are remuxed into mp4 by ffmpeg, if False (or ffmpeg is not found), the joined TS is the output
+    remux_ts: bool = True
 
     def __init__(
             self,
@@ -32,6 +120,7 @@ class BaseDownloaderM3u8(BaseDownloader):
             # unique params
             part_concurrency: int = 10,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
+            adaptive: bool = False,
     ):
         super(BaseDownloaderM3u8, self).__init__(
             client=client,
@@ -39,45 +128,180 @@ class BaseDownloaderM3u8(BaseDownloader):
             stream_retry=stream_retry,
             speed_limit=speed_limit,
             progress=progress,
-            logger=logger
+            logger=logger,
+            adaptive=adaptive,
         )
-        self.v_sema = asyncio.Semaphore(video_concurrency) if isinstance(video_concurrency, int) else video_concurrency
         self.part_concurrency = part_concurrency
-        self.decrypt_cache = {}
-
-    async def _decrypt(self, seg: m3u8.Segment, content: bytearray):
-        async def get_key():
-            key_bytes = (await req_retry(self.client, uri)).content
-            iv = bytes.fromhex(seg.key.iv.replace('0x', '')) if seg.key.iv is not None else \
-                seg.custom_parser_values['iv']
-            return AES.new(key_bytes, AES.MODE_CBC, iv)
-
-        uri = seg.key.absolute_uri
-        if uri not in self.decrypt_cache:
-            self.decrypt_cache[uri] = asyncio.ensure_future(get_key())
-            self.decrypt_cache[uri] = await self.decrypt_cache[uri]
-        elif asyncio.isfuture(self.decrypt_cache[uri]):
-            await self.decrypt_cache[uri]
-        cipher = self.decrypt_cache[uri]
-        return cipher.decrypt(content)
-
-    async def to_invariant_m3u8(self, m3u8_url: str) -> m3u8.M3U8:
+        if self.controller:
+            self.controller.add_level('part', part_concurrency)
+        self.v_sema = self._concurrency_sema('video', video_concurrency)
+        self.key_cache = KeyCache(self._fetch_key)
+        self._bandwidths: Dict[str, float] = {}  # media playlist url -> declared bits per second of the variant
+        self._estimators: Dict[int, SizeEstimator] = {}  # task id -> size estimator of the downloading video
+
+    async def _fetch_key(self, uri: str) -> bytes:
+        return (await req_retry(self.client, uri, follow_redirects=True)).content
+
+    async def _get_key(self, seg: m3u8.Segment) -> bytes:
+        """key of the segment, shared by segments (and videos) of the same key uri"""
+        return await self.key_cache.get(seg.key.absolute_uri)
+
+    @staticmethod
+    def _seg_iv(seg: m3u8.Segment) -> bytes:
+        if seg.key.iv is not None:
+            return bytes.fromhex(seg.key.iv.replace('0x', '').replace('0X', '').zfill(32))
+        return seg.custom_parser_values['iv']
+
+    async def to_invariant_m3u8(self, m3u8_url: str, quality: Union[int, str] = 0,
+                                max_bandwidth: int = None) -> m3u8.M3U8:
+        """
+        load media playlist, if m3u8_url is a master playlist, the variant is chosen by quality and max_bandwidth,
+        see choose_variant
+        """
         res = await req_retry(self.client, m3u8_url, follow_redirects=True)
         m3u8_info = m3u8.loads(res.text)
         if not m3u8_info.base_uri:
             m3u8_info.base_uri = m3u8_url
         if m3u8_info.is_variant:
-            self.logger.debug(f"m3u8 is variant, use first playlist: {m3u8_info.playlists[0].absolute_uri}")
-            return await self.to_invariant_m3u8(m3u8_info.playlists[0].absolute_uri)
+            variant = choose_variant(m3u8_info.playlists, quality, max_bandwidth)
+            self._bandwidths[variant.absolute_uri] = \
+                variant.stream_info.average_bandwidth or variant.stream_info.bandwidth
+            self.logger.debug(f"m3u8 is variant, use playlist: {variant.absolute_uri} "
+                              f"bandwidth: {variant.stream_info.bandwidth} resolution: {variant.stream_info.resolution}")
+            return await self.to_invariant_m3u8(variant.absolute_uri, quality, max_bandwidth)
         return m3u8_info
 
-    async def get_m3u8_video(self, m3u8_url: str, path: Union[str, Path], time_range: Tuple[int, int] = None) -> Path:
+    @staticmethod
+    def _resolve_byteranges(segments: Sequence[Segment]):
+        """
+        set custom_parser_values['range'] = (start, end) of segments with EXT-X-BYTERANGE,
+        the offset defaults to the end of the previous segment of the same uri
+        """
+        last = None
+        for seg in segments:
+            if not seg.byterange:
+                last = None
+                continue
+            length, _, offset = seg.byterange.partition('@')
+            if offset:
+                start = int(offset)
+            else:
+                start = last[1] if last and last[0] == seg.absolute_uri else 0
+            seg.custom_parser_values['range'] = (start, start + int(length))
+            last = (seg.absolute_uri, start + int(length))
+
+    @staticmethod
+    def _init_range(init_sec) -> Optional[Tuple[int, int]]:
+        if not init_sec.byterange:
+            return None
+        length, _, offset = init_sec.byterange.partition('@')
+        return int(offset or 0), int(offset or 0) + int(length)
+
+    def _plan_runs(self, segs: Sequence[Tuple[int, Segment]], written: Dict, max_len: int) -> List[List]:
+        """
+        group segments into runs fetched by one request, contiguous byteranges of the same uri are merged,
+        other segments (and encrypted ones, which are decrypted with their own iv) are runs of one
+        """
+        runs = []
+        size = 0
+        for idx, seg in segs:
+            rng = seg.custom_parser_values.get('range')
+            if runs and rng and not seg.key and idx not in written and len(runs[-1]) < max_len:
+                p_idx, p_seg = runs[-1][-1]
+                p_rng = p_seg.custom_parser_values.get('range')
+                if p_rng and not p_seg.key and p_idx not in written and p_seg.absolute_uri == seg.absolute_uri and \
+                        p_rng[1] == rng[0] and size + rng[1] - rng[0] <= self.byterange_coalesce:
+                    runs[-1].append((idx, seg))
+                    size += rng[1] - rng[0]
+                    continue
+            runs.append([(idx, seg)])
+            size = rng[1] - rng[0] if rng else 0
+        return runs
+
+    @staticmethod
+    def _seg_key(seg: Segment) -> Tuple[str, Optional[Tuple[int, int]]]:
+        return seg.absolute_uri, seg.custom_parser_values.get('range')
+
+    def _size_estimator(self, m3u8_info: m3u8.M3U8, segs: Sequence[Segment]) -> SizeEstimator:
+        """
+        estimator of segments, the rate before samples is declared by EXT-X-BITRATE of all segments,
+        or BANDWIDTH of the variant. sizes declared by byterange are exact
+        """
+        total_time = sum(seg.duration for seg in segs)
+        if total_time and all(seg.bitrate for seg in segs):  # kbps
+            rate = sum(seg.bitrate * 125 * seg.duration for seg in segs) / total_time
+        elif bandwidth := self._bandwidths.pop(m3u8_info.base_uri, None):
+            rate = bandwidth / 8
+        else:
+            rate = None
+        estimator = SizeEstimator({self._seg_key(seg): seg.duration for seg in segs}, rate=rate)
+        for seg in segs:
+            if rng := seg.custom_parser_values.get('range'):
+                estimator.add(self._seg_key(seg), rng[1] - rng[0])
+        return estimator
+
+    async def _probe_sizes(self, estimator: SizeEstimator, segs: Sequence[Segment], samples: int):
+        """sample sizes of segments spread over the playlist (beginning, middle, end...) by HEAD requests"""
+        candidates = [seg for seg in segs if self._seg_key(seg) not in estimator]
+        if not candidates or samples <= 0:
+            return
+        n = min(samples, len(candidates))
+        picked = {round(i * (len(candidates) - 1) / max(n - 1, 1)) for i in range(n)}
+
+        async def probe(seg: Segment):
+            try:
+                res = await self.client.head(seg.absolute_uri, follow_redirects=True)
+                res.raise_for_status()
+                if 'content-length' in res.headers and 'content-encoding' not in res.headers:
+                    size = int(res.headers['content-length'])
+                else:  # size of Content-Range
+                    res = await self.client.get(seg.absolute_uri, follow_redirects=True,
+                                                headers={'Range': 'bytes=0-0'})
+                    res.raise_for_status()
+                    size = int(res.headers['content-range'].split('/')[-1])
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                self.logger.debug(f"probe size failed {seg.absolute_uri}: {e!r}")
+                return
+            estimator.add(self._seg_key(seg), size)
+
+        await asyncio.gather(*[probe(candidates[i]) for i in sorted(picked)])
+
+    async def get_m3u8_size(self, m3u8_url: str, quality: Union[int, str] = 0,
+                            max_bandwidth: int = None) -> Optional[SizeEstimate]:
+        """
+        estimate the size of m3u8 video before download by probing a few segments
+
+        :param m3u8_url:
+        :param quality: variant of master playlist, see get_m3u8_video
+        :param max_bandwidth: max bits per second of the variant
+        :return: estimated total bytes with confidence interval, None if no segment can be probed
+        """
+        m3u8_info = await self.to_invariant_m3u8(m3u8_url, quality, max_bandwidth)
+        self._resolve_byteranges(m3u8_info.segments)
+        estimator = self._size_estimator(m3u8_info, m3u8_info.segments)
+        await self._probe_sizes(estimator, m3u8_info.segments, samples=self.size_samples * 2)
+        if (estimate := estimator.estimate()) is not None:
+            self.logger.info(f"{m3u8_url} 预计大小 {estimate}")
+        return estimate
+
+    @staticmethod
+    def _m3u8_validator(m3u8_info: m3u8.M3U8) -> Dict[str, str]:
+        """digest of segment uris (without query) and durations, to notice the change of playlist"""
+        h = hashlib.sha1()
+        for seg in m3u8_info.segments:
+            h.update(f"{urlparse(seg.uri).path}:{seg.duration}\n".encode())
+        return {'digest': h.hexdigest()}
+
+    async def get_m3u8_video(self, m3u8_url: str, path: Union[str, Path], time_range: Tuple[int, int] = None,
+                             quality: Union[int, str] = 0, max_bandwidth: int = None) -> Path:
         """
         download video from m3u8 url
         :cli: short: m3u8
         :param m3u8_url:
         :param path: file path or file dir, if dir, filename will be set according to m3u8_url
         :param time_range: (start, end) in seconds, if provided, only download the clip and add start-end to filename
+        :param quality: variant of master playlist, relative choice (0 is the highest bandwidth) or resolution like 720p
+        :param max_bandwidth: max bits per second of the variant
         :return: downloaded file path
         """
         if path.is_dir():
@@ -90,47 +314,38 @@ class BaseDownloaderM3u8(BaseDownloader):
             return path
         async with self.v_sema:
             task_id = await self.progress.add_task(total=None, description=path.name)
-            m3u8_info = await self.to_invariant_m3u8(m3u8_url)
-            cors = []
-            p_sema = asyncio.Semaphore(self.part_concurrency)
-            total_time = 0
+            m3u8_info = await self.to_invariant_m3u8(m3u8_url, quality, max_bandwidth)
+            init_sec = m3u8_info.segments[0].init_section if m3u8_info.segments else None
+            # segments are written in order into one file, fmp4 is the final output,
+            # ts is joined in process and only remuxed by ffmpeg if mp4 is wanted (clip always needs ffmpeg)
+            native_ts = not init_sec and not time_range and \
+                (path.suffix == '.ts' or not self.remux_ts or shutil.which('ffmpeg') is None)
+            if native_ts and path.suffix != '.ts':
+                if self.remux_ts:
+                    self.logger.warning(f"ffmpeg not found, {path.name} is saved as ts")
+                exist, path = path_check(path.with_suffix('.ts'))
+                await self.progress.update(task_id, description=path.name)
+                if exist:
+                    self.logger.info(f"[green]已存在[/green] {path.name}")
+                    await self.progress.update(task_id, visible=False)
+                    return path
+            tmp_path = path.with_name(f"{path.stem}.m3u8.{'part' if init_sec else 'ts'}")
+            self._resolve_byteranges(m3u8_info.segments)
             if time_range:
-                current_time = 0
                 start_time, end_time = time_range
-                inside = False
-            else:
-                inside = True
-            for idx, seg in enumerate(m3u8_info.segments):
-                if time_range:
-                    current_time += seg.duration
-                    if not inside and current_time > start_time:
-                        inside = True
-                        s = seg.duration - (current_time - start_time)
-                    elif current_time > end_time:
-                        break
-                if inside:
-                    total_time += seg.duration
-                    # https://stackoverflow.com/questions/50628791/decrypt-m3u8-playlist-encrypted-with-aes-128-without-iv
-                    if seg.key and seg.key.iv is None:
-                        seg.custom_parser_values['iv'] = idx.to_bytes(16, 'big')
-                    cors.append(self._get_seg(seg, path.with_name(f"{path.stem}-{idx}.ts"), task_id, p_sema))
-            if len(cors) == 0 and time_range:
-                raise Exception(f"time range <{start_time}-{end_time}> invalid for <{path.name}>")
-            if init_sec := m3u8_info.segments[0].init_section:
-                async def _get_init():
-                    r = await req_retry(self.client, init_sec.absolute_uri)
-                    async with aiofiles.open(fn := path.with_name(f"{path.stem}-init"), 'wb') as f:
-                        await f.write(r.content)
-                        return fn
-
-                cors.insert(0, _get_init())
-                merge_fn = merge_files
+                index = TimeIndex(seg.duration for seg in m3u8_info.segments)
+                first, last = index.locate(start_time, end_time)
+                if first == last:
+                    raise Exception(f"time range <{start_time}-{end_time}> invalid for <{path.name}>")
+                s = start_time - index.start_of(first)
             else:
-                merge_fn = ffmpeg.concat
-            await self.progress.update(task_id, total_time=total_time)
-            file_list = await asyncio.gather(*cors)
+                first, last = 0, len(m3u8_info.segments)
+            await self._download_segs(m3u8_info, range(first, last), tmp_path, task_id)
 
-        await merge_fn(file_list, path)
+        if init_sec or native_ts:
+            os.replace(tmp_path, path)
+        else:
+            await ffmpeg.concat([tmp_path], path)
         if time_range:
             path_tmp = path.with_stem(str(uuid.uuid4()))
             # to save key frame, use 0 as start time instead of s, clip will be a little longer than expected
@@ -140,55 +355,449 @@ class BaseDownloaderM3u8(BaseDownloader):
         await self.progress.update(task_id, visible=False)
         return path
 
-    async def _update_task_total(self, task_id, time_part: float, update_size: int):
+    async def _download_segs(self, m3u8_info: m3u8.M3U8, indexes: Sequence[int], tmp_path: Path,
+                             task_id) -> Dict[int, int]:
+        """
+        download segments of indexes (ascending) into tmp_path in order, preceded by the init section (key -1)
+        of fmp4 and joined by TSJoiner for ts. resumable by the journal beside tmp_path
+
+        :return: key -> size written, in file order
+        """
+        segments = m3u8_info.segments
+        init_sec = segments[0].init_section if segments else None
+        validator = self._m3u8_validator(m3u8_info)
+        journal_path = tmp_path.with_suffix('.json')
+        journal = Journal.load(journal_path) if tmp_path.exists() else None
+        if journal is None or not journal.match(len(segments), validator):
+            journal = Journal(journal_path, total=len(segments), validator=validator)
+        segs = []
+        for idx in indexes:
+            seg = segments[idx]
+            # https://stackoverflow.com/questions/50628791/decrypt-m3u8-playlist-encrypted-with-aes-128-without-iv
+            if seg.key and seg.key.iv is None:  # media sequence number as iv
+                seg.custom_parser_values['iv'] = ((m3u8_info.media_sequence or 0) + idx).to_bytes(16, 'big')
+            segs.append((idx, seg))
+        keys = [idx for idx, _ in segs]
+        if init_sec:
+            keys.insert(0, -1)  # init section is written first as key -1
+        # only leading segments completed in journal are kept, bytes after them are dropped
+        written = {}
+        for key in keys:
+            if key not in journal.segments:
+                break
+            written[key] = journal.segments[key]
+        with open(tmp_path, 'r+b' if written else 'wb') as f:
+            f.truncate(sum(written.values()))
+        # fetch keys before segments need them, rotating keys are fetched in playlist order
+        self.key_cache.prefetch(seg.key.absolute_uri for idx, seg in segs if seg.key and idx not in written)
+        joiner = None
+        if not init_sec:
+            joiner = TSJoiner()
+            if written:  # counters of the joined part
+                with open(tmp_path, 'rb') as f:
+                    f.seek(max(f.seek(0, os.SEEK_END) - TS_PACKET_SIZE * 4096, 0))
+                    joiner.resume(f.read())
+        handle = self.writer.open(tmp_path, append=True)
+        writer = OrderedWriter(handle, keys, window=self.part_concurrency * 4, written=written,
+                               transform=joiner.feed if joiner else None)
+        p_sema = self._concurrency_sema('part', self.part_concurrency)
+        cors = []
+        for run in self._plan_runs(segs, written, max_len=max(writer.window // 2, 1)):
+            if len(run) == 1:
+                cors.append(self._get_seg(run[0][1], run[0][0], task_id, p_sema, writer))
+            else:
+                cors.append(self._get_seg_run(run, task_id, p_sema, writer))
+        if init_sec:
+            async def _get_init():
+                if -1 not in writer.written:
+                    res = await req_retry(self.client, init_sec.absolute_uri, follow_redirects=True,
+                                          headers=_range_headers(self._init_range(init_sec)))
+                    await writer.put(-1, res.content)
+
+            cors.insert(0, _get_init())
+        await self.progress.update(task_id, total_time=sum(seg.duration for _, seg in segs))
+        estimator = self._estimators[task_id] = self._size_estimator(m3u8_info, [seg for _, seg in segs])
+        for idx, seg in segs:
+            if idx in writer.written:
+                estimator.add(self._seg_key(seg), writer.written[idx])
+
+        async def probe():
+            await self._probe_sizes(estimator, [seg for _, seg in segs], samples=self.size_samples)
+            if (estimate := estimator.estimate()) is not None:
+                self.logger.debug(f"{tmp_path.name} 预计大小 {estimate}")
+                await self.progress.update(task_id, total=estimate.total)
+
+        async def checkpoint():
+            while True:
+                await asyncio.sleep(1.)
+                journal.segments = dict(writer.written)
+                await handle.flush()  # segments recorded by journal are written
+                await journal.save(sync_path=tmp_path)
+
+        checkpoint_task = asyncio.create_task(checkpoint())
+        probe_task = asyncio.create_task(probe())
+        try:
+            await asyncio.gather(*cors)
+            await handle.close()
+        except BaseException:
+            handle.close_sync()
+            journal.segments = dict(writer.written)
+            if handle.error is None:
+                journal.dump(sync_path=tmp_path)
+            else:  # journal may record segments failed to write
+                journal.remove()
+            raise
+        finally:
+            checkpoint_task.cancel()
+            probe_task.cancel()
+            del self._estimators[task_id]
+        await self._account.flush()
+        if joiner and joiner.dropped:
+            self.logger.debug(f"{tmp_path.name} dropped {joiner.dropped} bytes out of ts sync")
+        journal.remove()
+        return writer.written
+
+    async def get_m3u8_clips(self, m3u8_url: str, path: Union[str, Path], time_ranges: Sequence[Tuple[int, int]],
+                             quality: Union[int, str] = 0, max_bandwidth: int = None) -> List[Path]:
+        """
+        download clips of many time ranges from one m3u8 video, segments shared by clips are downloaded once
+
+        :param m3u8_url:
+        :param path: file dir, or file path whose stem is the prefix of clip names
+        :param time_ranges: (start, end) in seconds of each clip, start-end is added to clip name
+        :param quality: variant of master playlist, see get_m3u8_video
+        :param max_bandwidth: max bits per second of the variant
+        :return: clip paths in the order of time_ranges
+        """
+        base = path / PurePath(urlparse(m3u8_url).path).stem if path.is_dir() else path.with_suffix('')
+        clip_paths = [path_check(base.with_name(f"{base.name}-{a}-{b}.mp4"))[1] for a, b in time_ranges]
+        todo = [i for i, clip_path in enumerate(clip_paths) if not clip_path.exists()]
+        for i in set(range(len(time_ranges))) - set(todo):
+            self.logger.info(f"[green]已存在[/green] {clip_paths[i].name}")
+        if not todo:
+            return clip_paths
+        async with self.v_sema:
+            m3u8_info = await self.to_invariant_m3u8(m3u8_url, quality, max_bandwidth)
+            self._resolve_byteranges(m3u8_info.segments)
+            index = TimeIndex(seg.duration for seg in m3u8_info.segments)
+            spans = {}
+            for i in todo:
+                first, last = index.locate(*time_ranges[i])
+                if first == last:
+                    raise Exception(f"time range <{time_ranges[i][0]}-{time_ranges[i][1]}> invalid for "
+                                    f"<{clip_paths[i].name}>")
+                spans[i] = first, last
+            indexes = sorted({idx for first, last in spans.values() for idx in range(first, last)})
+            init_sec = m3u8_info.segments[0].init_section
+            tmp_path = base.with_name(f"{base.name}.clips.m3u8.{'part' if init_sec else 'ts'}")
+            task_id = await self.progress.add_task(total=None, description=tmp_path.name)
+            written = await self._download_segs(m3u8_info, indexes, tmp_path, task_id)
+        # byte range [start, end) of each segment in the file, segments of the union may not be contiguous in time
+        offsets, pos = {}, 0
+        for key, size in written.items():
+            offsets[key] = pos, pos + size
+            pos += size
+        for i in todo:
+            first, last = spans[i]
+            src_path = clip_paths[i].with_name(f"{clip_paths[i].stem}.m3u8.{'part' if init_sec else 'ts'}")
+            start, end = offsets[first][0], offsets[last - 1][1]
+            with open(src_path, 'wb', buffering=0) as fdst, open(tmp_path, 'rb', buffering=0) as fsrc:
+                if init_sec:
+                    append_file(fdst, fsrc, size=written[-1])
+                append_file(fdst, fsrc, offset=start, size=end - start)
+            start_time, end_time = time_ranges[i]
+            s = start_time - index.start_of(first)
+            # to save key frame, use 0 as start time instead of s, clip will be a little longer than expected
+            await ffmpeg.time_range_clip(src_path, 0, end_time - start_time + s, clip_paths[i])
+            self.logger.info(f"[cyan]已完成[/cyan] {clip_paths[i].name}")
+        os.remove(tmp_path)
+        await self.progress.update(task_id, visible=False)
+        return clip_paths
+
+    async def get_m3u8_live(self, m3u8_url: str, path: Union[str, Path], duration: int = None,
+                            rotate: int = None, quality: Union[int, str] = 0, max_bandwidth: int = None) -> List[Path]:
+        """
+        record live stream from m3u8 url, until the stream ends, duration is reached or cancelled
+        :cli: short: live
+        :param m3u8_url:
+        :param path: file path or file dir, if dir, filename will be set according to m3u8_url and start time
+        :param duration: seconds of stream to record, record until the stream ends if not provided
+        :param rotate: seconds of stream in one file, if provided, start a new file named by start time every rotate
+        :param quality: variant of master playlist, see get_m3u8_video
+        :param max_bandwidth: max bits per second of the variant
+        :return: recorded file paths
+        """
+        m3u8_info = await self.to_invariant_m3u8(m3u8_url, quality, max_bandwidth)
+        media_url = m3u8_info.base_uri  # reload the media playlist directly
+        self._bandwidths.pop(media_url, None)
+        suffix = '.mp4' if m3u8_info.segments and m3u8_info.segments[0].init_section else '.ts'
+        stamped = rotate or path.is_dir()
+        if path.is_dir():
+            path = path / PurePath(urlparse(m3u8_url).path).stem
+
+        def next_path() -> Path:
+            file_path = path.with_suffix(suffix)
+            if stamped or path_check(file_path)[0]:
+                stem = f"{path.stem}-{time.strftime('%Y%m%d-%H%M%S')}"
+                file_path, n = path.with_name(stem + suffix), 0
+                while path_check(file_path)[0]:  # rotated in the same second
+                    n += 1
+                    file_path = path.with_name(f"{stem}-{n}{suffix}")
+            return file_path
+
+        paths: List[Path] = []
+        # downloading segments in order, bounded so that memory is flat when disk or network falls behind
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.part_concurrency * 4)
+        p_sema = self._concurrency_sema('part', self.part_concurrency)
+        task_id = await self.progress.add_task(total=None, description=path.name)
+
+        async def get_seg(seg: Segment, seq: int):
+            async with p_sema:
+                content = await self._download_seg(seg, seq, task_id, path.name, sized=True)
+            # bitrate of recorded segments, by which straggling segments without content-length are hedged
+            fields = self.progress.tasks[task_id].fields
+            await self.progress.update(task_id, confirmed_t=fields.get('confirmed_t', 0) + seg.duration,
+                                       confirmed_b=fields.get('confirmed_b', 0) + len(content))
+            return content
+
+        async def poll():
+            nonlocal m3u8_info
+            last_seq, scheduled = None, 0.
+            try:
+                while True:
+                    self._resolve_byteranges(m3u8_info.segments)
+                    seq0 = m3u8_info.media_sequence or 0
+                    new = [(seq0 + i, seg) for i, seg in enumerate(m3u8_info.segments)
+                           if last_seq is None or seq0 + i > last_seq]
+                    self.key_cache.prefetch(seg.key.absolute_uri for _, seg in new if seg.key)
+                    if new and last_seq is not None and new[0][0] > last_seq + 1:
+                        self.logger.warning(f"live {path.name} missed {new[0][0] - last_seq - 1} segments")
+                    for seq, seg in new:
+                        if duration and scheduled >= duration:
+                            break
+                        scheduled += seg.duration
+                        if seg.key and seg.key.iv is None:  # media sequence number as iv
+                            seg.custom_parser_values['iv'] = seq.to_bytes(16, 'big')
+                        fut = asyncio.ensure_future(get_seg(seg, seq))
+                        try:
+                            await queue.put((seg, fut))
+                        except BaseException:
+                            fut.cancel()
+                            raise
+                        last_seq = seq
+                    if m3u8_info.is_endlist or (duration and scheduled >= duration):
+                        break
+                    # reload after a target duration if playlist changed, else half of it (RFC 8216 6.3.4)
+                    await asyncio.sleep((m3u8_info.target_duration or 2) / (1 if new else 2))
+                    m3u8_info = await self.to_invariant_m3u8(media_url)
+            except Exception as e:  # stop recording, segments already scheduled are still written
+                self.logger.error(f"live {path.name} stopped: {e}")
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        async def record():
+            handle, joiner, file_time, init_uri = None, None, 0., None
+            try:
+                while (item := await queue.get()) is not None:
+                    seg, fut = item
+                    try:
+                        content = await fut
+                    except Exception as e:  # a lost segment should not stop the recording
+                        self.logger.warning(f"live {path.name} skip segment {seg.uri}: {e}")
+                        continue
+                    init_sec = seg.init_section
+                    if handle is None or (rotate and file_time >= rotate) or \
+                            (init_sec and init_sec.absolute_uri != init_uri):
+                        if handle is not None:
+                            await handle.close()
+                            self.logger.info(f"[cyan]已完成[/cyan] {handle.path.name}")
+                        file_path = next_path()
+                        with open(file_path, 'wb'):
+                            pass
+                        paths.append(file_path)
+                        handle, file_time = self.writer.open(file_path, append=True), 0.
+                        joiner = TSJoiner() if suffix == '.ts' else None
+                        await self.progress.update(task_id, description=file_path.name)
+                        if init_sec:  # every fmp4 file starts with the init section
+                            init_uri = init_sec.absolute_uri
+                            res = await req_retry(self.client, init_uri, follow_redirects=True,
+                                                  headers=_range_headers(self._init_range(init_sec)))
+                            await handle.write(res.content)
+                    await handle.write(joiner.feed(content) if joiner else content)
+                    file_time += seg.duration
+                if handle is not None:
+                    await handle.close()
+                    self.logger.info(f"[cyan]已完成[/cyan] {handle.path.name}")
+            except BaseException:
+                if handle is not None:
+                    handle.close_sync()
+                raise
+            finally:
+                while not queue.empty():
+                    if (item := queue.get_nowait()) is not None:
+                        item[1].cancel()
+
+        async with self.v_sema:
+            poll_task = asyncio.ensure_future(poll())
+            try:
+                await record()
+                await poll_task
+            finally:
+                poll_task.cancel()
+            await self._account.flush()
+        await self.progress.update(task_id, visible=False)
+        return paths
+
+    async def _update_task_total(self, task_id, seg: Segment, update_size: int):
+        """
+        record the size of a downloaded segment, and update the total of task by the size estimator,
+        or by the bitrate of confirmed segments if the estimator has no sample nor declared rate
+        """
         task = self.progress.tasks[task_id]
-        if task.total is None:
-            confirmed_t = time_part
-            confirmed_b = update_size
+        confirmed_t = seg.duration + task.fields.get('confirmed_t', 0)
+        confirmed_b = update_size + task.fields.get('confirmed_b', 0)
+        estimate = None
+        if (estimator := self._estimators.get(task_id)) is not None:
+            if run := seg.custom_parser_values.get('run'):  # merged run is recorded by its member segments
+                for member in run:
+                    a, b = member.custom_parser_values['range']
+                    estimator.add(self._seg_key(member), b - a)
+            else:
+                estimator.add(self._seg_key(seg), update_size)
+            estimate = estimator.estimate()
+        if estimate is not None:
+            predicted_total = estimate.total
         else:
-            confirmed_t = time_part + task.fields['confirmed_t']
-            confirmed_b = update_size + task.fields['confirmed_b']
-        predicted_total = task.fields['total_time'] * confirmed_b / confirmed_t
+            predicted_total = task.fields['total_time'] * confirmed_b / confirmed_t
         await self.progress.update(task_id, total=predicted_total, confirmed_t=confirmed_t, confirmed_b=confirmed_b)
 
-    async def _get_seg(self, seg: Segment, path: Path, task_id, p_sema: asyncio.Semaphore) -> Path:
-        exists, path = path_check(path)
-        if exists:
-            downloaded = os.path.getsize(path)
-            await self._update_task_total(task_id, time_part=seg.duration, update_size=downloaded)
+    async def _get_seg(self, seg: Segment, idx: int, task_id, p_sema, writer: OrderedWriter):
+        """
+        download segment and put it to the writer, segments already written (resume) are only accounted
+        """
+        if idx in writer.written:
+            downloaded = writer.written[idx]
+            await self._update_task_total(task_id, seg, update_size=downloaded)
             await self.progress.update(task_id, advance=downloaded)
-            return path
-        seg_url = seg.absolute_uri
+            return
+        # wait for earlier segments before taking a stream, so that the reorder buffer is bounded
+        await writer.reserve(idx)
+        async with p_sema:
+            content = await self._download_seg(seg, idx, task_id, writer.handle.path.name)
+        await writer.put(idx, content)
+
+    async def _get_seg_run(self, run: List[Tuple[int, Segment]], task_id, p_sema, writer: OrderedWriter):
+        """download contiguous byterange segments of one uri by a single range request and split them"""
+        first, last = run[0][1], run[-1][1]
+        start, end = first.custom_parser_values['range'][0], last.custom_parser_values['range'][1]
+        merged = Segment(uri=first.uri, base_uri=first.base_uri, duration=sum(seg.duration for _, seg in run),
+                         custom_parser_values={'range': (start, end), 'run': [seg for _, seg in run]})
+        await writer.reserve(run[-1][0])
         async with p_sema:
-            content = None
-            for times in range(1 + self.stream_retry):
-                content = bytearray()
-                try:
-                    async with self.client.stream("GET", seg_url,
-                                                  follow_redirects=True) as r, self._stream_context(times):
-                        r.raise_for_status()
-                        # pre-update total if content-length is provided and first time to get content
-                        if 'content-length' in r.headers and not content:
-                            await self._update_task_total(
-                                task_id, time_part=seg.duration, update_size=int(r.headers['content-length']))
-                        async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
+            content = await self._download_seg(merged, run[0][0], task_id, writer.handle.path.name, hook=False)
+        # runs are never encrypted, so the hook of each segment can be applied after download
+        for idx, seg in run:
+            a, b = seg.custom_parser_values['range']
+            await writer.put(idx, self._after_seg(seg, content[a - start:b - start]))
+
+    async def _download_seg(self, seg: Segment, idx: int, task_id, name: str, sized: bool = False,
+                            hook: bool = True) -> bytearray:
+        """
+        download content of segment, hedged if it straggles
+
+        :param sized: whether the task total is not updated by segments (such as live recording)
+        :param hook: apply _after_seg (before decrypt), False for merged segments which are hooked one by one
+        """
+        # shared by the hedge stream of the segment
+        state = {'advanced': 0, 'size': None, 'sized': sized, 'hook': hook}
+
+        def straggling(elapsed: float):
+            if (size := state['size']) is None:  # estimate size by bytes per second of known segments
+                estimator = self._estimators.get(task_id)
+                fields = self.progress.tasks[task_id].fields
+                if estimator is not None and (ratio := estimator.ratio) is not None:
+                    size = seg.duration * ratio
+                elif fields.get('confirmed_t'):
+                    size = seg.duration * fields['confirmed_b'] / fields['confirmed_t']
+                else:  # no sample yet
+                    return False
+            return elapsed > self.hedge_delay and \
+                elapsed * self._expected_speed([seg.absolute_uri]) > self.hedge_ratio * size
+
+        def start(hedge: bool):
+            if hedge:
+                self.logger.debug(f"STREAM hedge straggling segment {idx} of {name}")
+            return self._get_seg_content(seg, task_id, state)
+
+        return await hedged(start, straggling, self.hedge_stats)
+
+    async def _get_seg_content(self, seg: Segment, task_id, state: dict) -> bytearray:
+        """
+        download content of segment with retry, state is shared by streams (hedge) of the same segment,
+        so that bytes are accounted only once.
+        encrypted segment is decrypted while downloading, large batches are decrypted in executor.
+        if _after_seg is overridden, it's applied to the raw content, and encrypted content is decrypted after it
+        """
+        seg_url = seg.absolute_uri
+        rng = seg.custom_parser_values.get('range')
+        key = await self._get_key(seg) if seg.key else None
+        hooked = state['hook'] and type(self)._after_seg is not BaseDownloaderM3u8._after_seg
+        loop = asyncio.get_running_loop()
+        for times in range(1 + self.stream_retry):
+            content = bytearray()
+            received = 0
+            # the hook needs the whole raw content, then it's decrypted at once
+            decryptor = SegmentDecryptor(key, self._seg_iv(seg)) if key and not hooked else None
+            raw = bytearray()  # encrypted bytes not decrypted yet
+            a = time.monotonic()
+            try:
+                async with self.client.stream("GET", seg_url, follow_redirects=True,
+                                              headers=_range_headers(rng)) as r, self._stream_context(times):
+                    r.raise_for_status()
+                    if rng and r.status_code != 206:
+                        raise Exception(f"STREAM range not supported {seg_url}")
+                    # size for straggling check, and pre-update total if first time to get content
+                    if 'content-length' in r.headers and state['size'] is None:
+                        state['size'] = int(r.headers['content-length'])
+                        if not state['sized']:
+                            state['sized'] = True
+                            await self._update_task_total(task_id, seg, update_size=state['size'])
+                    async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
+                        received += len(chunk)
+                        if decryptor is None:
                             content.extend(chunk)
-                            await self.progress.update(task_id, advance=len(chunk))
-                            await self._check_speed(len(chunk))
-                    if 'content-length' not in r.headers:  # after-update total if content-length is not provided
-                        await self._update_task_total(task_id, time_part=seg.duration, update_size=len(content))
-                    break
-                except (httpx.HTTPStatusError, httpx.TransportError):
-                    continue
-            else:
-                raise Exception(f"STREAM 超过重复次数 {seg_url}")
-        content = self._after_seg(seg, content)
-        # in case encrypted
-        if seg.key:
-            content = await self._decrypt(seg, content)
-        async with aiofiles.open(path, 'wb') as f:
-            await f.write(content)
-        return path
+                        elif len(raw) + len(chunk) < self.decrypt_batch:
+                            raw.extend(chunk)
+                        else:
+                            raw.extend(chunk)
+                            content.extend(await loop.run_in_executor(None, decryptor.update, bytes(raw)))
+                            raw.clear()
+                        # bytes may be accounted by a previous try or another stream already
+                        if (advance := received - state['advanced']) > 0:
+                            state['advanced'] += advance
+                            self._account.advance(task_id, advance)
+                        if advance < len(chunk):
+                            self.hedge_stats.wasted += len(chunk) - max(advance, 0)
+                        if self.rate_limiter:
+                            await self.rate_limiter.consume(len(chunk))
+                if decryptor:
+                    content.extend(decryptor.update(raw))
+                    content.extend(decryptor.finalize())
+                if state['hook']:
+                    content = self._after_seg(seg, content)
+                if key and hooked:
+                    decryptor = SegmentDecryptor(key, self._seg_iv(seg))
+                    content = bytearray(await loop.run_in_executor(None, decryptor.update, bytes(content)))
+                    content.extend(decryptor.finalize())
+                if not state['sized']:  # after-update total if content-length is not provided
+                    state['sized'] = True
+                    await self._update_task_total(task_id, seg, update_size=received)
+                self.mirrors.record_speed(seg_url, received / max(time.monotonic() - a, 1e-3))
+                return content
+            except (httpx.HTTPStatusError, httpx.TransportError):
+                continue
+        raise Exception(f"STREAM 超过重复次数 {seg_url}")
 
     def _after_seg(self, seg: Segment, content: bytearray) -> bytearray:
         """hook for subclass to modify segment content, happened before decrypt"""
@@ -0,0 +1,335 @@
+import asyncio
+import os
+import re
+import httpx
+import m3u8
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+from bilix.download.base_downloader_m3u8 import BaseDownloaderM3u8, SegmentDecryptor, choose_variant
+from bilix.download.estimate import SizeEstimator
+from bilix.download.journal import Journal
+
+init = os.urandom(100)
+segs = [os.urandom(1000 + i) for i in range(20)]
+playlist = '#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MAP:URI="init.mp4"\n' + \
+           ''.join(f'#EXTINF:2.0,\n{i}.m4s\n' for i in range(len(segs))) + '#EXT-X-ENDLIST\n'
+requested = []
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    name = request.url.path.split('/')[-1]
+    requested.append(name)
+    if name == 'index.m3u8':
+        return httpx.Response(200, text=playlist)
+    if name == 'init.mp4':
+        return httpx.Response(200, content=init)
+    return httpx.Response(200, content=segs[int(name.split('.')[0])])
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+    assert os.listdir(tmp_path) == ['v.mp4']
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_resume(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        m3u8_info = await d.to_invariant_m3u8('http://example.com/v/index.m3u8')
+        journal = Journal(tmp_path / 'v.m3u8.json', total=len(segs), validator=d._m3u8_validator(m3u8_info))
+        journal.segments[-1] = len(init)
+        for i in range(10):
+            journal.segments[i] = len(segs[i])
+        # segment 10 is incomplete and not recorded in journal
+        (tmp_path / 'v.m3u8.part').write_bytes(init + b''.join(segs[:10]) + segs[10][:10])
+        journal.dump()
+        requested.clear()
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+    assert '0.m4s' not in requested and 'init.mp4' not in requested and '10.m4s' in requested
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_slow_first_byte(tmp_path):
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        # size probes return at once, segments wait longer than the hedge poll before the first byte
+        if request.method == 'GET' and request.url.path.endswith('.m4s'):
+            await asyncio.sleep(.7)
+        return handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+
+
+key = os.urandom(16)
+enc_playlist = '#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MAP:URI="init.mp4"\n' \
+               '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"\n' + \
+               ''.join(f'#EXTINF:2.0,\n{i}.m4s\n' for i in range(len(segs))) + '#EXT-X-ENDLIST\n'
+
+
+def encrypt(data: bytes, idx: int) -> bytes:
+    return AES.new(key, AES.MODE_CBC, idx.to_bytes(16, 'big')).encrypt(pad(data, AES.block_size))
+
+
+def enc_handler(request: httpx.Request) -> httpx.Response:
+    name = request.url.path.split('/')[-1]
+    if name == 'index.m3u8':
+        return httpx.Response(200, text=enc_playlist)
+    if name == 'key.bin':
+        return httpx.Response(200, content=key)
+    if name == 'init.mp4':
+        return httpx.Response(200, content=init)
+    idx = int(name.split('.')[0])
+    return httpx.Response(200, content=encrypt(segs[idx], idx))
+
+
+def test_segment_decryptor():
+    data = os.urandom(1000)
+    decryptor = SegmentDecryptor(key, bytes(16))
+    enc = encrypt(data, 0)
+    out = b''
+    for i in range(0, len(enc), 7):
+        out += decryptor.update(enc[i:i + 7])
+    assert out + decryptor.finalize() == data
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_encrypted(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(enc_handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        d.decrypt_batch = 512  # decrypt in executor too
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+
+
+
+class StripDownloader(BaseDownloaderM3u8):
+    def _after_seg(self, seg, content):
+        # like sites disguising segments as png, the header is outside the encrypted content
+        return content[len(b'junk'):]
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_encrypted_hook(tmp_path):
+    def junk_handler(request: httpx.Request) -> httpx.Response:
+        res = enc_handler(request)
+        if request.url.path.endswith('.m4s'):
+            return httpx.Response(200, content=b'junk' + res.content)
+        return res
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(junk_handler))
+    async with StripDownloader(client=client) as d:
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+
+def ts_packets(n: int, pid: int = 0x100) -> bytes:
+    """packets of a segment, continuity counter restarts from 0 in every segment"""
+    return b''.join(bytes([0x47, pid >> 8, pid & 0xFF, 0x10 | k & 0x0F]) + os.urandom(184) for k in range(n))
+
+
+ts_segs = [ts_packets(5 + i) for i in range(20)]
+
+
+def assert_joined(data: bytes, segments):
+    """data is segments joined, with continuity counters continued across segments"""
+    assert len(data) == sum(map(len, segments))
+    assert all(data[i + 3] & 0x0F == (i // 188) & 0x0F for i in range(0, len(data), 188))
+    mask = lambda b: bytes(x for i, x in enumerate(b) if i % 188 != 3)
+    assert mask(data) == mask(b''.join(segments))
+
+
+class LiveHandler:
+    """a live playlist sliding forward step segments per reload, ended after all segments"""
+
+    def __init__(self, window: int = 10, step: int = 7):
+        self.window = window
+        self.step = step
+        self.reloads = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        name = request.url.path.split('/')[-1]
+        if name != 'live.m3u8':
+            return httpx.Response(200, content=ts_segs[int(name.split('.')[0])])
+        start = min(self.reloads * self.step, len(segs) - self.window)
+        self.reloads += 1
+        text = f'#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXT-X-MEDIA-SEQUENCE:{start}\n' + \
+               ''.join(f'#EXTINF:0.5,\n{i}.ts\n' for i in range(start, start + self.window))
+        if start == len(segs) - self.window:
+            text += '#EXT-X-ENDLIST\n'
+        return httpx.Response(200, text=text)
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_live(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(LiveHandler()))
+    async with BaseDownloaderM3u8(client=client) as d:
+        paths = await d.get_m3u8_live('http://example.com/v/live.m3u8', path=tmp_path / 'live.ts', rotate=5)
+    assert len(paths) == 2 and all(p.name.startswith('live-') for p in paths)
+    assert_joined(paths[0].read_bytes(), ts_segs[:10])
+    assert_joined(paths[1].read_bytes(), ts_segs[10:])
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_live_hedge(tmp_path):
+    live, stalled = LiveHandler(), []
+
+    async def stall_handler(request: httpx.Request) -> httpx.Response:
+        # first request of a segment stalls before headers, so its size is only known by recorded bitrate
+        if request.url.path.endswith('/12.ts') and not stalled:
+            stalled.append(request)
+            await asyncio.sleep(5)
+        return live(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(stall_handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        d.hedge_delay = .1
+        paths = await asyncio.wait_for(
+            d.get_m3u8_live('http://example.com/v/live.m3u8', path=tmp_path / 'live.ts'), 4)
+        assert d.hedge_stats.hedged >= 1
+    assert_joined(paths[0].read_bytes(), ts_segs)
+
+@pytest.mark.asyncio
+async def test_get_m3u8_live_duration(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(LiveHandler()))
+    async with BaseDownloaderM3u8(client=client) as d:
+        paths = await d.get_m3u8_live('http://example.com/v/live.m3u8', path=tmp_path / 'live.ts', duration=3)
+    assert paths == [tmp_path / 'live.ts']
+    assert_joined(paths[0].read_bytes(), ts_segs[:6])
+
+
+def test_choose_variant():
+    master = m3u8.loads('#EXTM3U\n'
+                        '#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n360.m3u8\n'
+                        '#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080\n1080.m3u8\n'
+                        '#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720\n720.m3u8\n')
+    uri = lambda *args, **kwargs: choose_variant(master.playlists, *args, **kwargs).uri
+    assert uri() == '1080.m3u8'
+    assert uri(1) == '720.m3u8'
+    assert uri(999) == '360.m3u8'
+    assert uri('720p') == '720.m3u8'
+    assert uri('4k') == '1080.m3u8'
+    assert uri(max_bandwidth=3000000) == '720.m3u8'
+    assert uri(max_bandwidth=100) == '360.m3u8'
+    with pytest.raises(ValueError):
+        uri('best')
+
+
+def byterange_handler(request: httpx.Request) -> httpx.Response:
+    name = request.url.path.split('/')[-1]
+    requested.append(name)
+    if name == 'index.m3u8':
+        text = f'#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MAP:URI="all.mp4",BYTERANGE="{len(init)}@0"\n'
+        offset = len(init)
+        for i, seg in enumerate(segs):
+            # offset is omitted for segments following the previous one
+            text += f'#EXTINF:2.0,\n#EXT-X-BYTERANGE:{len(seg)}{"" if i % 5 else f"@{offset}"}\nall.mp4\n'
+            offset += len(seg)
+        return httpx.Response(200, text=text + '#EXT-X-ENDLIST\n')
+    start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', request.headers['Range']).groups())
+    return httpx.Response(206, content=(init + b''.join(segs))[start:end + 1])
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_byterange(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(byterange_handler))
+    requested.clear()
+    async with BaseDownloaderM3u8(client=client, part_concurrency=2) as d:
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4')
+    assert path.read_bytes() == init + b''.join(segs)
+    # init + 20 segments merged by runs of at most window // 2 = 4 segments
+    assert requested.count('all.mp4') == 1 + 5
+
+
+@pytest.mark.asyncio
+async def test_update_task_total():
+    base = 'http://example.com/v/'
+    members = [m3u8.Segment(uri='all.mp4', base_uri=base, duration=2., custom_parser_values={'range': (i, i + 100)})
+               for i in range(0, 400, 100)]
+    async with BaseDownloaderM3u8() as d:
+        task_id = await d.progress.add_task(description='v', total=None)
+        await d.progress.update(task_id, total_time=8.)
+        d._estimators[task_id] = SizeEstimator({d._seg_key(seg): seg.duration for seg in members})
+        # unknown segment without declared rate, estimated by confirmed bytes
+        await d._update_task_total(task_id, m3u8.Segment(uri='x.mp4', base_uri=base, duration=2.), update_size=50)
+        assert d.progress.tasks[task_id].total == 200
+        # merged run is recorded by its members
+        merged = m3u8.Segment(uri='all.mp4', base_uri=base, duration=8.,
+                              custom_parser_values={'range': (0, 400), 'run': members})
+        await d._update_task_total(task_id, merged, update_size=400)
+        assert d.progress.tasks[task_id].total == 400
+
+@pytest.mark.asyncio
+async def test_get_m3u8_size():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        estimate = await d.get_m3u8_size('http://example.com/v/index.m3u8')
+    assert estimate.low <= sum(map(len, segs)) <= estimate.high
+    client = httpx.AsyncClient(transport=httpx.MockTransport(byterange_handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        estimate = await d.get_m3u8_size('http://example.com/v/index.m3u8')
+    assert estimate.total == estimate.low == estimate.high == sum(map(len, segs))
+
+
+def ts_handler(request: httpx.Request) -> httpx.Response:
+    name = request.url.path.split('/')[-1]
+    if name == 'index.m3u8':
+        return httpx.Response(200, text='#EXTM3U\n#EXT-X-TARGETDURATION:2\n' + ''.join(
+            f'#EXTINF:2.0,\n{i}.ts\n' for i in range(len(ts_segs))) + '#EXT-X-ENDLIST\n')
+    idx = int(name.split('.')[0])
+    # junk before the first packet is dropped
+    return httpx.Response(200, content=(b'\x89PNG' if idx == 3 else b'') + ts_segs[idx])
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_video_ts(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(ts_handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        path = await d.get_m3u8_video('http://example.com/v/index.m3u8', path=tmp_path / 'v.ts')
+    assert path == tmp_path / 'v.ts'
+    assert_joined(path.read_bytes(), ts_segs)
+    assert os.listdir(tmp_path) == ['v.ts']
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_clips(tmp_path, monkeypatch):
+    clipped = {}
+
+    async def time_range_clip(input_path, start, t, output_path, remove=True):
+        clipped[output_path.name] = t
+        os.replace(input_path, output_path)
+
+    monkeypatch.setattr('bilix.ffmpeg.time_range_clip', time_range_clip)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    requested.clear()
+    async with BaseDownloaderM3u8(client=client) as d:
+        paths = await d.get_m3u8_clips('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4',
+                                       time_ranges=[(3, 7), (5, 11)])
+    # segments [1, 4) and [2, 6), the shared ones are downloaded once
+    assert [p.name for p in paths] == ['v-3-7.mp4', 'v-5-11.mp4']
+    assert paths[0].read_bytes() == init + b''.join(segs[1:4])
+    assert paths[1].read_bytes() == init + b''.join(segs[2:6])
+    assert clipped == {'v-3-7.mp4': 5, 'v-5-11.mp4': 7}
+    assert set(requested) == {'index.m3u8', 'init.mp4'} | {f'{i}.m4s' for i in range(1, 6)}
+    assert sorted(os.listdir(tmp_path)) == ['v-3-7.mp4', 'v-5-11.mp4']
+
+
+@pytest.mark.asyncio
+async def test_get_m3u8_clips_disjoint(tmp_path, monkeypatch):
+    async def time_range_clip(input_path, start, t, output_path, remove=True):
+        os.replace(input_path, output_path)
+
+    monkeypatch.setattr('bilix.ffmpeg.time_range_clip', time_range_clip)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    async with BaseDownloaderM3u8(client=client) as d:
+        paths = await d.get_m3u8_clips('http://example.com/v/index.m3u8', path=tmp_path / 'v.mp4',
+                                       time_ranges=[(3, 7), (21, 25)])
+    # segments [1, 4) and [10, 13) are adjacent in the downloaded file, clips don't take each other's segments
+    assert paths[0].read_bytes() == init + b''.join(segs[1:4])
+    assert paths[1].read_bytes() == init + b''.join(segs[10:13])
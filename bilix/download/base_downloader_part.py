@@ -1,24 +1,69 @@
 import asyncio
 from pathlib import Path, PurePath
-from typing import Union, List, Iterable, Tuple
+from typing import Union, List, Iterable, Tuple, Optional, Dict, Callable, Sequence
 from urllib.parse import urlparse
-import aiofiles
 import httpx
 import uuid
-import random
+from itertools import accumulate
 import os
+import shutil
+import tempfile
+import time
 from email.message import Message
 from pymp4.parser import Box
 from bilix.download.base_downloader import BaseDownloader
-from bilix.download.utils import path_check, merge_files
+from bilix.download.utils import path_check, merge_files, preallocate
+from bilix.download.journal import Journal
+from bilix.download.writer import WriteHandle, PipeHandle
+from bilix.download.hedge import hedged
+from bilix.download.time_index import TimeIndex
+from bilix.exception import RemoteChangedError
 from bilix import ffmpeg
 from .utils import req_retry
 
 __all__ = ['BaseDownloaderPart']
 
 
+class FilePart:
+    """mutable content range [start, end] of a file, start moves forward while downloading"""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.downloaded = 0
+        self.begin_time = time.monotonic()
+        self.url_idx: Optional[int] = None  # mirror used by the latest stream
+
+    def restart(self):
+        """measure speed from now on, called when a stream starts, parts may wait long (resume, queue) before"""
+        self.downloaded = 0
+        self.begin_time = time.monotonic()
+
+    @property
+    def remaining(self) -> int:
+        return max(self.end - self.start + 1, 0)
+
+    @property
+    def speed(self) -> float:
+        """average speed (byte/s) of this part since it started"""
+        return self.downloaded / max(time.monotonic() - self.begin_time, 1e-3)
+
+    def split(self, min_size: int) -> Optional['FilePart']:
+        """cut the second half of remaining range off as a new part, return None if remaining is too small"""
+        if self.remaining < 2 * min_size:
+            return None
+        mid = self.start + self.remaining // 2
+        part = FilePart(mid, self.end)
+        self.end = mid - 1
+        return part
+
+
 class BaseDownloaderPart(BaseDownloader):
     """Base Async http Content-Range Downloader"""
+    # parts smaller than this will not be split by work stealing
+    min_part_size: int = 1024 * 1024
+    # size of in-order parts when a file is streamed into a pipe
+    stream_part_size: int = 4 * 1024 * 1024
 
     def __init__(
             self,
@@ -31,20 +76,39 @@ class BaseDownloaderPart(BaseDownloader):
             logger=None,
             # unique params
             part_concurrency: int = 10,
+            preallocate: bool = True,
+            adaptive: bool = False,
+            stream_mux: bool = False,
     ):
+        """
+
+        :param part_concurrency: concurrency of content-range parts for each file
+        :param preallocate: write all parts into one preallocated file at their own offset instead of merging
+            part files after download
+        :param stream_mux: mux streams (such as dash video and audio) by ffmpeg while downloading them through pipes,
+            instead of combining downloaded files. not resumable, only available with ffmpeg and fifo support
+        """
         super(BaseDownloaderPart, self).__init__(
             client=client,
             browser=browser,
             stream_retry=stream_retry,
             speed_limit=speed_limit,
             progress=progress,
-            logger=logger
+            logger=logger,
+            adaptive=adaptive,
         )
         self.part_concurrency = part_concurrency
+        if self.controller:
+            self.controller.add_level('part', part_concurrency)
+        self.preallocate = preallocate
+        self.stream_mux = stream_mux and hasattr(os, 'mkfifo') and shutil.which('ffmpeg') is not None
+        if stream_mux and not self.stream_mux:
+            self.logger.warning("stream mux needs ffmpeg and fifo support, downloaded files will be combined instead")
 
-    async def _pre_req(self, urls: List[str]) -> Tuple[int, str]:
+    async def _pre_req(self, urls: List[str]) -> Tuple[int, str, Dict[str, str]]:
         # use GET instead of HEAD due to 404 bug https://github.com/HFrost0/bilix/issues/16
-        res = await req_retry(self.client, urls[0], follow_redirects=True, headers={'Range': 'bytes=0-1'})
+        res = await req_retry(self.client, urls, follow_redirects=True, headers={'Range': 'bytes=0-1'},
+                              mirrors=self.mirrors)
         total = int(res.headers['Content-Range'].split('/')[-1])
         # get filename
         if content_disposition := res.headers.get('Content-Disposition', None):
@@ -55,8 +119,57 @@ class BaseDownloaderPart(BaseDownloader):
             filename = ''
         # change origin url to redirected position to avoid twice redirect
         if res.history:
-            urls[0] = str(res.url)
-        return total, filename
+            origin = res.history[0].url
+            urls[:] = [str(res.url) if httpx.URL(url) == origin else url for url in urls]
+        return total, filename, self._validator(res)
+
+    @staticmethod
+    def _validator(res: httpx.Response) -> Dict[str, str]:
+        """headers which identify the version of remote object"""
+        return {k: res.headers[k] for k in ('ETag', 'Last-Modified') if k in res.headers}
+
+    def _remote_checker(self, total: int, validator: Dict[str, str],
+                        validate: bool) -> Callable[[httpx.Response], None]:
+        """
+        make a check for range responses of a file. total size is checked for every response. if validate,
+        the first response is also checked against validator and fills keys unknown yet (only the first one,
+        since backup mirrors may not agree on validator)
+        """
+        first = validate
+
+        def check(res: httpx.Response):
+            nonlocal first
+            if (content_range := res.headers.get('Content-Range')) and \
+                    content_range.split('/')[-1] not in ('*', str(total)):
+                raise RemoteChangedError(f"remote file size {content_range} is not {total}")
+            if first:
+                first = False
+                for k, v in self._validator(res).items():
+                    if validator.setdefault(k, v) != v:
+                        raise RemoteChangedError(f"remote file {k} changed from {validator[k]} to {v}")
+
+        return check
+
+    @staticmethod
+    def _coalesce_ranges(ranges: List[Tuple[int, int]], n: int) -> List[Tuple[int, int]]:
+        """
+        merge adjacent ranges into at most n groups of similar size (if all are contiguous), split only at
+        boundaries of the given ranges
+        """
+        total = sum(end - start + 1 for start, end in ranges)
+        merged = []
+        acc, k, cut = 0, 1, False
+        for start, end in ranges:
+            if merged and merged[-1][1] + 1 == start and not cut:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+            acc += end - start + 1
+            # cut after this range when the group reaches the next 1/n of total
+            cut = False
+            while k < n and acc >= total * k / n:
+                k, cut = k + 1, True
+        return [(start, end) for start, end in merged]
 
     async def get_media_clip(
             self,
@@ -91,8 +204,8 @@ class BaseDownloaderPart(BaseDownloader):
         urls = [url_or_urls] if isinstance(url_or_urls, str) else [url for url in url_or_urls]
         init_start, init_end = map(int, init_range.split('-'))
         seg_start, seg_end = map(int, seg_range.split('-'))
-        res = await req_retry(self.client, urls[0], follow_redirects=True,
-                              headers={'Range': f'bytes={seg_start}-{seg_end}'})
+        res = await req_retry(self.client, urls, follow_redirects=True,
+                              headers={'Range': f'bytes={seg_start}-{seg_end}'}, mirrors=self.mirrors)
         container = Box.parse(res.content)
         assert container.type == b'sidx'
         if get_s:
@@ -100,28 +213,24 @@ class BaseDownloaderPart(BaseDownloader):
             end_time = time_range[1]
         else:
             start_time, end_time = time_range
-        pre_time, pre_byte = 0, seg_end + 1
-        inside = False
-        parts = [(init_start, init_end)]
-        total = init_end - init_start + 1
-        s = 0
-        for idx, ref in enumerate(container.references):
+        # byte offset of each reference follows the sidx box
+        offsets = accumulate((ref.referenced_size for ref in container.references), initial=seg_end + 1)
+        refs = []
+        for ref, offset in zip(container.references, offsets):
             if ref.reference_type != "MEDIA":
                 self.logger.debug("not a media", ref)
                 continue
-            seg_duration = ref.segment_duration / container.timescale
-            if not inside and start_time < pre_time + seg_duration:
-                s = start_time - pre_time
-                inside = True
-            if inside and end_time < pre_time:
-                break
-            if inside:
-                total += ref.referenced_size
-                parts.append((pre_byte, pre_byte + ref.referenced_size - 1))
-            pre_time += seg_duration
-            pre_byte += ref.referenced_size
+            refs.append((ref, offset))
+        index = TimeIndex(ref.segment_duration / container.timescale for ref, _ in refs)
+        first, last = index.locate(start_time, end_time)
+        s = start_time - index.start_of(first)
+        parts = [(init_start, init_end)] + [
+            (offset, offset + ref.referenced_size - 1) for ref, offset in refs[first:last]]
+        total = sum(end - start + 1 for start, end in parts)
         if len(parts) == 1:
             raise Exception(f"time range <{start_time}-{end_time}> invalid for <{path.name}>")
+        # contiguous media segments are requested in a few large ranges instead of one range per segment
+        parts = parts[:1] + self._coalesce_ranges(parts[1:], max(self.part_concurrency - 1, 1))
         if set_s:
             set_s.set_result(start_time - s)
         if task_id is not None:
@@ -130,13 +239,14 @@ class BaseDownloaderPart(BaseDownloader):
                 total=self.progress.tasks[task_id].total + total if self.progress.tasks[task_id].total else total)
         else:
             task_id = await self.progress.add_task(description=path.name, total=total)
-        p_sema = asyncio.Semaphore(self.part_concurrency)
+        p_sema = self._concurrency_sema('part', self.part_concurrency)
 
         async def get_seg(part_range: Tuple[int, int]):
             async with p_sema:
                 return await self._get_file_part(urls, path=path, part_range=part_range, task_id=task_id)
 
         file_list = await asyncio.gather(*[get_seg(part_range) for part_range in parts])
+        await self._account.flush()
         path_tmp = path.with_name(str(uuid.uuid4()))
         await merge_files(file_list, path_tmp)
         if set_s:
@@ -148,13 +258,16 @@ class BaseDownloaderPart(BaseDownloader):
             self.logger.info(f"[cyan]已完成[/cyan] {path.name}")
         return path
 
-    async def get_file(self, url_or_urls: Union[str, Iterable[str]], path: Union[Path, str], task_id=None) -> Path:
+    async def get_file(self, url_or_urls: Union[str, Iterable[str]], path: Union[Path, str], task_id=None,
+                       size: int = None, filename: str = None) -> Path:
         """
         download file by http content-range
         :cli: short: f
         :param url_or_urls: file url or urls with backups
         :param path: file path or dir path, if dir path, filename will be extracted from url
         :param task_id: if not provided, a new progress task will be created
+        :param size: known file size, if provided (and filename for dir path), the size request is skipped
+        :param filename: known filename, used when path is a dir
         :return: downloaded file path
         """
         urls = [url_or_urls] if isinstance(url_or_urls, str) else [url for url in url_or_urls]
@@ -167,7 +280,11 @@ class BaseDownloaderPart(BaseDownloader):
                     self.logger.info(f'[green]已存在[/green] {path.name}')
                 return path
 
-        total, req_filename = await self._pre_req(urls)
+        if size and (filename or not path.is_dir()):
+            # size request is skipped, remote file is checked by the first range response
+            total, req_filename, validator = size, filename, None
+        else:
+            total, req_filename, validator = await self._pre_req(urls)
 
         if path.is_dir():
             file_name = req_filename if req_filename else PurePath(urlparse(urls[0]).path).name
@@ -184,50 +301,342 @@ class BaseDownloaderPart(BaseDownloader):
                 total=self.progress.tasks[task_id].total + total if self.progress.tasks[task_id].total else total)
         else:
             task_id = await self.progress.add_task(description=path.name, total=total)
-        part_length = total // self.part_concurrency
-        cors = []
-        for i in range(self.part_concurrency):
-            start = i * part_length
-            end = (i + 1) * part_length - 1 if i < self.part_concurrency - 1 else total - 1
-            cors.append(self._get_file_part(urls, path=path, part_range=(start, end), task_id=task_id))
-        file_list = await asyncio.gather(*cors)
-        await merge_files(file_list, new_path=path)
+        if self.preallocate:
+            await self._get_file_inplace(urls, path=path, total=total, validator=validator, task_id=task_id)
+        else:
+            part_length = total // self.part_concurrency
+            cors = []
+            check = self._remote_checker(total, {}, validate=False)
+            for i in range(self.part_concurrency):
+                start = i * part_length
+                end = (i + 1) * part_length - 1 if i < self.part_concurrency - 1 else total - 1
+                cors.append(self._get_file_part(urls, path=path, part_range=(start, end), task_id=task_id,
+                                                check=check))
+            file_list = await asyncio.gather(*cors)
+            await merge_files(file_list, new_path=path)
+        await self._account.flush()
         if not upper:
             await self.progress.update(task_id, visible=False)
             self.logger.info(f"[cyan]已完成[/cyan] {path.name}")
         return path
 
-    async def _get_file_part(self, urls: List[str], path: Path, part_range: Tuple[int, int],
-                             task_id) -> Path:
-        start, end = part_range
-        part_path = path.with_name(f'{path.name}.{part_range[0]}-{part_range[1]}')
-        exist, part_path = path_check(part_path)
+    async def _get_file_inplace(self, urls: List[str], path: Path, total: int, validator: Optional[Dict[str, str]],
+                                task_id, interval: float = 1.):
+        """
+        download all parts into a preallocated file, each part writes at its own offset.
+        remaining ranges are saved in a journal for resuming, the journal is dropped if remote object changed.
+        if validator is None (size is hinted), the first range response is validated against the journal instead.
+        when a worker finishes its part early, it steals the second half of the part with the longest expected
+        remaining time, so that a slow connection will not hold the whole file.
+
+        :param interval: interval in seconds to save the journal
+        """
+        tmp_path = path.with_name(f'{path.name}.part')
+        journal = Journal.load(path.with_name(f'{path.name}.part.json')) if tmp_path.exists() else None
+        if journal is not None and not journal.match(total, validator or {}):
+            self.logger.info(f"remote file changed since last download, restart {path.name}")
+            journal = None
+        if journal is None:
+            journal = Journal(path.with_name(f'{path.name}.part.json'), total=total, validator=validator)
+            part_length = total // self.part_concurrency
+            parts = []
+            for i in range(self.part_concurrency):
+                start = i * part_length
+                end = (i + 1) * part_length - 1 if i < self.part_concurrency - 1 else total - 1
+                parts.append(FilePart(start, end))
+            await asyncio.get_running_loop().run_in_executor(None, preallocate, tmp_path, total)
+            journal.ranges = [[part.start, part.end] for part in parts]
+            await journal.save()
+        else:
+            parts = [FilePart(start, end) for start, end in journal.ranges]
+            if downloaded := total - sum(part.remaining for part in parts):
+                await self.progress.update(task_id, advance=downloaded)
+
+        handle = self.writer.open(tmp_path)
+        check = self._remote_checker(total, journal.validator, validate=validator is None)
+
+        async def checkpoint():
+            while True:
+                await asyncio.sleep(interval)
+                journal.ranges = [[part.start, part.end] for part in parts if part.remaining]
+                await handle.flush()  # bytes recorded by journal are written
+                await journal.save(sync_path=tmp_path)
+
+        p_sema = self._concurrency_sema('part', self.part_concurrency)
+        pending = [part for part in parts if part.remaining]
+
+        async def worker():
+            while True:
+                async with p_sema:
+                    part = pending.pop(0) if pending else self._steal_part(parts)
+                    if part is None:
+                        return
+                    await self._get_file_range_hedged(urls, handle, part, task_id, check=check)
+
+        # when adaptive, extra workers wait for the level increasing and then steal parts
+        worker_num = self.controller.maximum('part') if self.controller else self.part_concurrency
+        checkpoint_task = asyncio.create_task(checkpoint())
+        try:
+            await asyncio.gather(*[worker() for _ in range(worker_num)])
+            await handle.close()
+        except BaseException as e:
+            journal.ranges = [[part.start, part.end] for part in parts if part.remaining]
+            handle.close_sync()
+            if handle.error is None and not isinstance(e, RemoteChangedError):
+                journal.dump(sync_path=tmp_path)
+            else:  # journal may record bytes failed to write, or a wrong remote file
+                journal.remove()
+            raise
+        finally:
+            checkpoint_task.cancel()
+        os.replace(tmp_path, path)
+        journal.remove()
+
+    async def get_muxed(self, urls_lst: Sequence[Union[str, Iterable[str]]], path: Path, task_id=None,
+                        sizes: Sequence[Optional[int]] = None) -> Path:
+        """
+        download streams (such as dash video and audio) and mux them into path by ffmpeg at the same time. every
+        stream is downloaded by in-order parts and fed into a fifo read by ffmpeg, so the muxed file is ready right
+        after the last byte arrives and no intermediate file is left. a failed download is restarted next time.
+
+        :param urls_lst: url or urls with backups of each stream
+        :param path: muxed file path
+        :param task_id: if not provided, a new progress task will be created
+        :param sizes: known sizes of streams, the size request is skipped for known ones
+        :return: muxed file path
+        """
+        upper = task_id is not None and self.progress.tasks[task_id].fields.get('upper', None)
+        exist, path = path_check(path)
         if exist:
-            downloaded = os.path.getsize(part_path)
-            start += downloaded
-            await self.progress.update(task_id, advance=downloaded)
-        if start > end:
-            return part_path  # skip already finished
-        url_idx = random.randint(0, len(urls) - 1)
+            if not upper:
+                self.logger.info(f'[green]已存在[/green] {path.name}')
+            return path
+        urls_lst = [[urls] if isinstance(urls, str) else list(urls) for urls in urls_lst]
+        totals, validators = [], []
+        for urls, size in zip(urls_lst, sizes or [None] * len(urls_lst)):
+            total, _, validator = (size, '', {}) if size else await self._pre_req(urls)
+            totals.append(total)
+            validators.append(validator)
+        if task_id is not None:
+            total = sum(totals)
+            await self.progress.update(
+                task_id,
+                total=self.progress.tasks[task_id].total + total if self.progress.tasks[task_id].total else total)
+        else:
+            task_id = await self.progress.add_task(description=path.name, total=sum(totals))
+        fifo_dir = Path(tempfile.mkdtemp(prefix='bilix-'))
+        fifos = [fifo_dir / str(i) for i in range(len(urls_lst))]
+        for fifo in fifos:
+            os.mkfifo(fifo)
+        started = asyncio.Event()
+        tasks = [asyncio.create_task(ffmpeg.mux(fifos, path, started=started))]
+        waiter = asyncio.create_task(started.wait())
+        try:
+            # fifos are opened after ffmpeg is running, or ffmpeg failed to start
+            await asyncio.wait([tasks[0], waiter], return_when=asyncio.FIRST_COMPLETED)
+            if started.is_set():
+                tasks.extend(asyncio.create_task(self._stream_file(urls, fifo, total, validator, task_id))
+                             for urls, fifo, total, validator in zip(urls_lst, fifos, totals, validators))
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            for fifo in fifos:  # release writers still waiting for ffmpeg to open the fifo
+                os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if path.exists():
+                os.remove(path)
+            raise
+        finally:
+            waiter.cancel()
+            shutil.rmtree(fifo_dir)
+        await self._account.flush()
+        if not upper:
+            await self.progress.update(task_id, visible=False)
+            self.logger.info(f"[cyan]已完成[/cyan] {path.name}")
+        return path
+
+    async def _stream_file(self, urls: List[str], fifo: Path, total: int, validator: Dict[str, str], task_id):
+        """
+        download file into fifo in order. parts are taken in offset order by workers, so the part at the pipe
+        position is always being downloaded, and streams ahead of it wait within the window of the pipe.
+        """
+        handle = PipeHandle(fifo, window=self.part_concurrency * self.stream_part_size)
+        await handle.open()
+        check = self._remote_checker(total, validator, validate=True)
+        parts = [FilePart(start, min(start + self.stream_part_size, total) - 1)
+                 for start in range(0, total, self.stream_part_size)]
+        pending = list(parts)
+        p_sema = self._concurrency_sema('part', self.part_concurrency)
+
+        async def worker():
+            while True:
+                async with p_sema:
+                    part = pending.pop(0) if pending else self._steal_part(parts)
+                    if part is None:
+                        return
+                    # not hedged, a part waiting for the pipe would look straggling
+                    await self._get_file_range(urls, handle, part, task_id, check=check)
+
+        worker_num = self.controller.maximum('part') if self.controller else self.part_concurrency
+        try:
+            await asyncio.gather(*[worker() for _ in range(worker_num)])
+            await handle.close()
+        except BaseException:
+            handle.close_sync()
+            raise
+
+    def _steal_part(self, parts: List[FilePart]) -> Optional[FilePart]:
+        """split the part which is expected to finish last, the new part is appended to parts"""
+        started = [p.speed for p in parts if p.downloaded]
+        # parts without any data yet are assumed to be as fast as the average
+        avg_speed = sum(started) / len(started) if started else 1.
+
+        def time_left(p: FilePart):
+            return p.remaining / max(p.speed if p.downloaded else avg_speed, 1.)
 
-        for times in range(1 + self.stream_retry):
+        for victim in sorted(parts, key=time_left, reverse=True):
+            if (part := victim.split(self.min_part_size)) is not None:
+                parts.append(part)
+                return part
+        return None
+
+    async def _get_file_range_hedged(self, urls: List[str], handle: WriteHandle, part: FilePart, task_id,
+                                     check: Callable[[httpx.Response], None] = None):
+        """download range of part, with a hedge stream on another mirror if the stream is straggling"""
+
+        def straggling(_):
+            # expected to finish much later than at the speed of other streams, which is measured by hedge_delay
+            return part.remaining and part.speed * self.hedge_ratio < self._expected_speed(urls) and \
+                time.monotonic() - part.begin_time > self.hedge_delay
+
+        part.restart()
+
+        def start(hedge: bool):
+            if hedge:
+                self.logger.debug(f"STREAM hedge straggling range {part.start}-{part.end} of {handle.path.name}")
+            return self._get_file_range(urls, handle, part, task_id, check=check,
+                                        exclude=part.url_idx if hedge else None)
+
+        await hedged(start, straggling, self.hedge_stats)
+
+    async def _get_file_range(self, urls: List[str], handle: WriteHandle, part: FilePart, task_id,
+                              check: Callable[[httpx.Response], None] = None, exclude: int = None):
+        """
+        download range of part and write it to the same offset of file, part.start is moved forward along with the
+        written bytes, part.end may be moved backward by work stealing during download.
+        more than one stream (hedge) may download the same part, only bytes ahead of part.start are accounted.
+        check is called with every range response before reading content.
+        speed of mirror is measured by the time waiting for content only, and not at all if the stream is paced by
+        rate limiter or by the reader of a pipe, since the socket buffer fills up while blocked.
+        """
+        measure = self.rate_limiter is None and not isinstance(handle, PipeHandle)
+        url_idx = self.mirrors.choose(urls, exclude=exclude)
+        times = 0
+        while True:
+            if not part.remaining:
+                return  # already finished, maybe by another stream
+            url, better_idx = urls[url_idx], None
+            part.url_idx = url_idx
+            pos = part.start
+            stat = self.mirrors.stat(url)
+            stat.active += 1
             try:
+                a = time.monotonic()
                 async with \
-                        self.client.stream("GET", urls[url_idx], follow_redirects=True,
-                                           headers={'Range': f'bytes={start}-{end}'}) as r, \
-                        self._stream_context(times), \
-                        aiofiles.open(part_path, 'ab') as f:
+                        self.client.stream("GET", url, follow_redirects=True,
+                                           headers={'Range': f'bytes={pos}-{part.end}'}) as r, \
+                        self._stream_context(times):
                     r.raise_for_status()
+                    if check:
+                        check(r)
+                    self.mirrors.record_latency(url, time.monotonic() - a)
                     if r.history:  # avoid twice redirect
                         urls[url_idx] = r.url
+                    win_t, win_bytes = 0., 0
+                    tick = time.monotonic()
                     async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
-                        await f.write(chunk)
-                        start += len(chunk)
-                        await self.progress.update(task_id, advance=len(chunk))
-                        await self._check_speed(len(chunk))
-                break
+                        win_t += time.monotonic() - tick
+                        chunk = chunk[:part.end + 1 - pos]  # end may be moved by work stealing
+                        await handle.write(chunk, pos)
+                        pos += len(chunk)
+                        # end may also be moved during write (bytes after it belong to the stolen part),
+                        # and a hedge stream of the part may be ahead
+                        if (advance := min(pos, part.end + 1) - part.start) > 0:
+                            part.start += advance
+                            part.downloaded += advance
+                            self._account.advance(task_id, advance)
+                        if advance < len(chunk):
+                            self.hedge_stats.wasted += len(chunk) - max(advance, 0)
+                        if self.rate_limiter:
+                            await self.rate_limiter.consume(len(chunk))
+                        if pos > part.end:
+                            break
+                        win_bytes += len(chunk)
+                        if measure and win_t >= 1.:
+                            self.mirrors.record_speed(url, win_bytes / win_t)
+                            # move to a much better mirror if current one degrades
+                            if part.remaining > self.min_part_size and \
+                                    (better_idx := self.mirrors.better(urls, url_idx, win_bytes / win_t)) is not None:
+                                break
+                            win_t, win_bytes = 0., 0
+                        tick = time.monotonic()
+                    if measure and better_idx is None and win_t >= .2:
+                        self.mirrors.record_speed(url, win_bytes / win_t)
             except (httpx.HTTPStatusError, httpx.TransportError):
+                self.mirrors.record_error(url)
+                times += 1
+                if times > self.stream_retry:
+                    raise Exception(f"STREAM 超过重复次数 {handle.path.name} {part.start}-{part.end}")
+                url_idx = self.mirrors.choose(urls, exclude=url_idx)
                 continue
-        else:
-            raise Exception(f"STREAM 超过重复次数 {part_path.name}")
+            finally:
+                stat.active -= 1
+            if better_idx is None:
+                break
+            self.logger.debug(f"STREAM switch mirror {urls[url_idx]} -> {urls[better_idx]}")
+            url_idx = better_idx
+
+    async def _get_file_part(self, urls: List[str], path: Path, part_range: Tuple[int, int],
+                             task_id, check: Callable[[httpx.Response], None] = None) -> Path:
+        start, end = part_range
+        part_path = path.with_name(f'{path.name}.{part_range[0]}-{part_range[1]}')
+        exist, part_path = path_check(part_path)
+        if exist:
+            downloaded = os.path.getsize(part_path)
+            start += downloaded
+            await self.progress.update(task_id, advance=downloaded)
+        if start > end:
+            return part_path  # skip already finished
+        url_idx = self.mirrors.choose(urls)
+        handle = self.writer.open(part_path)
+        try:
+            for times in range(1 + self.stream_retry):
+                try:
+                    a = time.monotonic()
+                    async with \
+                            self.client.stream("GET", urls[url_idx], follow_redirects=True,
+                                               headers={'Range': f'bytes={start}-{end}'}) as r, \
+                            self._stream_context(times):
+                        r.raise_for_status()
+                        if check:
+                            check(r)
+                        self.mirrors.record_latency(urls[url_idx], time.monotonic() - a)
+                        if r.history:  # avoid twice redirect
+                            urls[url_idx] = r.url
+                        async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
+                            await handle.write(chunk, start - part_range[0])
+                            start += len(chunk)
+                            self._account.advance(task_id, len(chunk))
+                            if self.rate_limiter:
+                                await self.rate_limiter.consume(len(chunk))
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError):
+                    self.mirrors.record_error(urls[url_idx])
+                    url_idx = self.mirrors.choose(urls, exclude=url_idx)
+                    continue
+            else:
+                raise Exception(f"STREAM 超过重复次数 {part_path.name}")
+        finally:
+            await handle.close()
         return part_path
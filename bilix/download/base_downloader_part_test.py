@@ -0,0 +1,253 @@
+import asyncio
+import os
+import random
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from bilix import ffmpeg
+from bilix.download.base_downloader_part import BaseDownloaderPart, FilePart
+from bilix.download.journal import Journal
+from bilix.exception import RemoteChangedError
+
+data = os.urandom(1024 * 1024 + 7)
+etag = '"bilix"'
+requested = []
+
+
+def range_handler(request: httpx.Request) -> httpx.Response:
+    start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', request.headers['Range']).groups())
+    requested.append((start, end))
+    end = min(end, len(data) - 1)
+    return httpx.Response(206, content=data[start:end + 1],
+                          headers={'Content-Range': f'bytes {start}-{end}/{len(data)}', 'ETag': etag})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('preallocate, adaptive', [(True, False), (False, False), (True, True)])
+async def test_get_file(tmp_path, preallocate, adaptive):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    async with BaseDownloaderPart(client=client, part_concurrency=4, preallocate=preallocate, adaptive=adaptive) as d:
+        path = await d.get_file('http://example.com/file.bin', path=tmp_path / 'file.bin')
+    assert path.read_bytes() == data
+    assert os.listdir(tmp_path) == ['file.bin']
+
+
+@pytest.mark.asyncio
+async def test_get_file_resume(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    d = BaseDownloaderPart(client=client, part_concurrency=2)
+    path = tmp_path / 'file.bin'
+    # simulate an interrupted download: first half of the first part is done
+    half = len(data) // 4
+    tmp = path.with_name(f'{path.name}.part')
+    tmp.write_bytes(data[:half] + bytes(len(data) - half))
+    journal = Journal(path.with_name(f'{path.name}.part.json'), total=len(data), validator={'ETag': etag})
+    journal.ranges = [[half, len(data) // 2 - 1], [len(data) // 2, len(data) - 1]]
+    journal.dump()
+    requested.clear()
+    async with d:
+        await d.get_file('http://example.com/file.bin', path=path)
+    assert path.read_bytes() == data
+    assert (half, len(data) // 2 - 1) in requested
+
+
+@pytest.mark.asyncio
+async def test_get_file_resume_remote_changed(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    d = BaseDownloaderPart(client=client, part_concurrency=2)
+    path = tmp_path / 'file.bin'
+    tmp = path.with_name(f'{path.name}.part')
+    tmp.write_bytes(bytes(len(data)))
+    journal = Journal(path.with_name(f'{path.name}.part.json'), total=len(data), validator={'ETag': '"old"'})
+    journal.ranges = [[len(data) // 2, len(data) - 1]]
+    journal.dump()
+    async with d:
+        await d.get_file('http://example.com/file.bin', path=path)
+    assert path.read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_get_file_work_stealing(tmp_path):
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        start, end = map(int, re.fullmatch(r'bytes=(\d+)-(\d+)', request.headers['Range']).groups())
+        requested.append((start, end))
+
+        async def stream():
+            # the range starting from 0 is very slow
+            for i in range(start, end + 1, 4096):
+                if start == 0:
+                    await asyncio.sleep(0.01)
+                yield data[i:min(i + 4096, end + 1)]
+
+        return httpx.Response(206, content=stream(), headers={'Content-Range': f'bytes {start}-{end}/{len(data)}'})
+
+    requested.clear()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler))
+    async with BaseDownloaderPart(client=client, part_concurrency=4) as d:
+        d.min_part_size = 16 * 1024
+        path = await d.get_file('http://example.com/file.bin', path=tmp_path / 'file.bin')
+    assert path.read_bytes() == data
+    assert len(requested) > 5  # pre request + 4 parts + stolen parts
+
+
+@pytest.mark.asyncio
+async def test_get_file_size_hint(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    requested.clear()
+    async with BaseDownloaderPart(client=client, part_concurrency=4) as d:
+        path = await d.get_file('http://example.com/file.bin', path=tmp_path / 'file.bin', size=len(data))
+        assert path.read_bytes() == data
+        # no size request
+        assert (0, 1) not in requested and len(requested) == 4
+        with pytest.raises(RemoteChangedError):
+            await d.get_file('http://example.com/file.bin', path=tmp_path / 'wrong.bin', size=len(data) + 1)
+    assert not (tmp_path / 'wrong.bin.part.json').exists()
+
+
+@pytest.mark.asyncio
+async def test_get_file_hedge(tmp_path):
+    stalled = []
+
+    async def stall_handler(request: httpx.Request) -> httpx.Response:
+        # the first stream of the last part stalls
+        if request.headers['Range'].startswith(f'bytes={len(data) // 2}-') and not stalled:
+            stalled.append(request)
+            await asyncio.sleep(30)
+        return range_handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(stall_handler))
+    async with BaseDownloaderPart(client=client, part_concurrency=2) as d:
+        d.hedge_delay = .2
+        d.mirrors.record_speed('http://example.com', 1e6)
+        path = await d.get_file('http://example.com/file.bin', path=tmp_path / 'file.bin')
+    assert path.read_bytes() == data
+    assert d.hedge_stats.hedged == 1 and d.hedge_stats.won == 1
+
+
+def test_coalesce_ranges():
+    ranges = [(i * 10, i * 10 + 9) for i in range(100)]
+    merged = BaseDownloaderPart._coalesce_ranges(ranges, 9)
+    assert len(merged) == 9
+    assert merged[0][0] == 0 and merged[-1][1] == 999
+    assert all(a[1] + 1 == b[0] for a, b in zip(merged, merged[1:]))
+    # only split at boundaries of given ranges
+    assert all(start % 10 == 0 for start, _ in merged)
+    # not contiguous ranges are never merged
+    assert BaseDownloaderPart._coalesce_ranges([(0, 9), (20, 29), (30, 39)], 1) == [(0, 9), (20, 39)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='fifo not supported')
+async def test_stream_file(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    os.mkfifo(tmp_path / 'fifo')
+    read = asyncio.get_running_loop().run_in_executor(None, (tmp_path / 'fifo').read_bytes)
+    async with BaseDownloaderPart(client=client, part_concurrency=3) as d:
+        d.stream_part_size = 100 * 1024
+        task_id = await d.progress.add_task(description='fifo', total=len(data))
+        await d._stream_file(['http://example.com/file.bin'], tmp_path / 'fifo', len(data), {}, task_id)
+    assert await read == data
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='fifo not supported')
+async def test_get_muxed(tmp_path, monkeypatch):
+    # an ffmpeg which reads its inputs one after another and writes them to output
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    (bin_path / 'ffmpeg').write_text(
+        f'#!{sys.executable}\n'
+        'import sys\n'
+        'ins = [sys.argv[i + 1] for i, a in enumerate(sys.argv) if a == "-i"]\n'
+        'with open(sys.argv[-1], "wb") as out:\n'
+        '    for p in ins:\n'
+        '        out.write(open(p, "rb").read())\n')
+    (bin_path / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_path}{os.pathsep}{os.environ["PATH"]}')
+    # more muxes than ffmpeg workers and default executor threads
+    monkeypatch.setattr(ffmpeg.pool, '_max_workers', 1)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(range_handler))
+    async with BaseDownloaderPart(client=client, part_concurrency=2, stream_mux=True) as d:
+        assert d.stream_mux
+        d.stream_part_size = 64 * 1024
+        paths = await asyncio.wait_for(asyncio.gather(*[
+            d.get_muxed(['http://example.com/v.bin', 'http://example.com/a.bin'], tmp_path / f'{i}.mp4')
+            for i in range(4)]), 30)
+    for path in paths:
+        assert path.read_bytes() == data * 2
+    assert sorted(os.listdir(tmp_path)) == ['0.mp4', '1.mp4', '2.mp4', '3.mp4', 'bin']
+
+
+@pytest.mark.asyncio
+async def test_get_file_failing_mirror(tmp_path):
+    def mirror_handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == 'bad.example.com':
+            requested.append('bad')
+            return httpx.Response(503)
+        return range_handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(mirror_handler))
+    urls = ['http://bad.example.com/file.bin', 'http://good.example.com/file.bin']
+    random.seed(0)  # mirrors are chosen at random by score
+    requested.clear()
+    async with BaseDownloaderPart(client=client, part_concurrency=4, preallocate=False, stream_retry=1) as d:
+        path = await d.get_file(urls, path=tmp_path / 'file.bin')
+        # every request failed on the bad mirror is retried on the other one
+        assert path.read_bytes() == data
+        assert d.mirrors.stat(urls[0]).errors == requested.count('bad') > 0
+        assert d.mirrors.score(urls[0]) < d.mirrors.score(urls[1])
+
+
+@pytest.mark.asyncio
+async def test_resumed_part_not_hedged(tmp_path):
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(.7)
+        return range_handler(request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler))
+    urls = ['http://example.com/file.bin']
+    async with BaseDownloaderPart(client=client) as d:
+        d.mirrors.record_speed(urls[0], 1e6)
+        part = FilePart(0, len(data) - 1)
+        part.begin_time -= 100  # restored from journal long ago
+        handle = d.writer.open(tmp_path / 'file.bin')
+        task_id = await d.progress.add_task(description='file.bin', total=len(data))
+        await d._get_file_range_hedged(urls, handle, part, task_id)
+        await handle.close()
+        assert d.hedge_stats.hedged == 0
+    assert (tmp_path / 'file.bin').read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_speed_excludes_write(tmp_path):
+    class SlowHandle:
+        def __init__(self, handle):
+            self.handle = handle
+            self.path = handle.path
+
+        async def write(self, chunk, offset):
+            await asyncio.sleep(.05)  # disk or reader is slower than network
+            await self.handle.write(chunk, offset)
+
+    def chunked_handler(request: httpx.Request) -> httpx.Response:
+        res = range_handler(request)
+
+        async def chunks():
+            for i in range(0, len(res.content), 32 * 1024):
+                yield res.content[i:i + 32 * 1024]
+
+        return httpx.Response(206, content=chunks(), headers=res.headers)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(chunked_handler))
+    urls = ['http://example.com/file.bin']
+    async with BaseDownloaderPart(client=client) as d:
+        handle = d.writer.open(tmp_path / 'file.bin')
+        task_id = await d.progress.add_task(description='file.bin', total=len(data))
+        await d._get_file_range(urls, SlowHandle(handle), FilePart(0, len(data) - 1), task_id)
+        await handle.close()
+        # time blocked by writes is not counted as slowness of the mirror
+        assert d.mirrors.stat(urls[0]).speed is None or d.mirrors.stat(urls[0]).speed > 10 * 1024 * 1024
+    assert (tmp_path / 'file.bin').read_bytes() == data
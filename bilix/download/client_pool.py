@@ -0,0 +1,107 @@
+"""
+process-wide registry of connection pools, so that downloaders of different sites running at the same time
+share connections and TLS sessions instead of opening duplicate pools
+"""
+import asyncio
+import urllib.request
+import weakref
+from typing import Dict, Tuple
+
+import httpcore
+import httpx
+
+from bilix.download.dns import CachingBackend
+
+__all__ = ['dft_limits', 'SharedTransport', 'get_transport', 'get_client']
+
+# pool limits of shared transports, larger than httpx default since the pool is shared by downloaders
+dft_limits = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.)
+
+_registry: Dict[Tuple, 'SharedTransport'] = {}
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport shared by clients with the same pool settings. Connections of every host are pooled by
+    the underlying httpx transport, one for each event loop since connections can not cross event loops.
+    Host names are resolved by the dns cache with ttl.
+    The pool is closed when the last client using it is closed.
+    """
+
+    def __init__(self, key: Tuple, http2: bool = False, verify=True, limits: httpx.Limits = dft_limits):
+        self.key = key
+        self.http2 = http2
+        self.verify = verify
+        self.limits = limits
+        self._transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._refs = 0
+
+    def _acquire(self):
+        self._refs += 1
+
+    def _get(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        if (transport := self._transports.get(loop)) is None:
+            transport = self._transports[loop] = httpx.AsyncHTTPTransport(
+                http2=self.http2, verify=self.verify, limits=self.limits)
+            # resolve hosts by the process-wide dns cache, httpx does not expose the backend of its pool
+            if (pool := getattr(transport, '_pool', None)) is not None and hasattr(pool, '_network_backend'):
+                pool._network_backend = CachingBackend(pool._network_backend)
+        return transport
+
+    def has_connection(self, url: str) -> bool:
+        """whether the pool of current event loop holds a live connection which can serve the origin of url"""
+        transport = self._transports.get(asyncio.get_running_loop())
+        if (pool := getattr(transport, '_pool', None)) is None:
+            return False
+        u = httpx.URL(url)
+        origin = httpcore.Origin(u.raw_scheme, u.raw_host, u.port or {b'http': 80, b'https': 443}[u.raw_scheme])
+        return any(conn.can_handle_request(origin) and not conn.is_closed() and not conn.has_expired()
+                   for conn in pool.connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._get().handle_async_request(request)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_val=None, exc_tb=None):
+        await self.aclose()
+
+    async def aclose(self):
+        self._refs -= 1
+        if self._refs > 0:
+            return
+        if _registry.get(self.key) is self:
+            del _registry[self.key]
+        loop = asyncio.get_running_loop()
+        if (transport := self._transports.pop(loop, None)) is not None:
+            await transport.aclose()
+        # pools of other loops are dropped with their loops
+        self._transports.clear()
+
+
+def get_transport(http2: bool = False, verify=True, limits: httpx.Limits = None) -> SharedTransport:
+    """get the shared transport of the settings, every call should be paired with an aclose of the transport"""
+    limits = limits or dft_limits
+    key = (http2, verify, limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry)
+    if (transport := _registry.get(key)) is None:
+        transport = _registry[key] = SharedTransport(key, http2=http2, verify=verify, limits=limits)
+    transport._acquire()
+    return transport
+
+
+def get_client(**settings) -> httpx.AsyncClient:
+    """
+    create a client using the shared transport, headers and cookies are still owned by the client.
+    when a proxy is set by param or environment, the client gets its own pool as usual.
+
+    :param settings: params of httpx.AsyncClient, such as headers, cookies, http2, limits
+    :return:
+    """
+    if any(k in settings for k in ('transport', 'mounts', 'proxy')) or \
+            (settings.get('trust_env', True) and urllib.request.getproxies()):
+        return httpx.AsyncClient(**settings)
+    transport = get_transport(http2=settings.pop('http2', False), verify=settings.pop('verify', True),
+                              limits=settings.pop('limits', None))
+    return httpx.AsyncClient(transport=transport, **settings)
@@ -0,0 +1,56 @@
+import asyncio
+import httpx
+import pytest
+from bilix.download.base_downloader import BaseDownloader
+from bilix.download.client_pool import get_client, get_transport, _registry
+
+
+@pytest.mark.asyncio
+async def test_get_client(monkeypatch):
+    for name in ('http_proxy', 'https_proxy', 'all_proxy'):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+    a = get_client(headers={'referer': 'https://a.com'})
+    b = get_client(headers={'referer': 'https://b.com'}, http2=False)
+    c = get_client(http2=True)
+    assert a._transport is b._transport
+    assert c._transport is not a._transport
+    assert a.headers['referer'] != b.headers['referer']
+    async with a:
+        pass
+    # still used by b
+    assert b._transport.key in _registry
+    await b.aclose()
+    await c.aclose()
+    assert not _registry
+
+
+@pytest.mark.asyncio
+async def test_prewarm_skips_connected_host():
+    methods = []
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # keep-alive http/1.1 server answering every request with an empty body
+        try:
+            while request := await reader.readuntil(b'\r\n\r\n'):
+                methods.append(request.split(b' ')[0])
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+        except asyncio.IncompleteReadError:  # connection closed by client
+            writer.close()
+
+    server = await asyncio.start_server(serve, '127.0.0.1', 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v.m4s"
+    transport = get_transport()
+    client = httpx.AsyncClient(transport=transport)
+    async with BaseDownloader(client=client) as d:
+        assert not transport.has_connection(url)
+        d._prewarm([url, url])
+        await asyncio.gather(*d._prewarm_tasks.values())
+        assert methods == [b'HEAD']  # warmed once
+        assert transport.has_connection(url)
+        d._prewarm([url])
+        assert not d._prewarm_tasks
+    assert methods == [b'HEAD']
+    server.close()
+    await server.wait_closed()
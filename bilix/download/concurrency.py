@@ -0,0 +1,156 @@
+"""
+adaptive concurrency control by additive increase / multiplicative decrease (AIMD)
+"""
+import asyncio
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from bilix.log import logger
+
+__all__ = ['AIMDController', 'AdaptiveSemaphore']
+
+
+class AIMDController:
+    """
+    Adjust concurrency levels of a downloader by aggregate throughput.
+
+    Every interval, if throughput keeps rising and some saturated level is below its maximum, the level is
+    increased by one (part level first, then video level). Error burst (403, 429, TransportError...) halves
+    part level, and also video level when part level is already at minimum.
+    """
+
+    def __init__(self, interval: float = 2., rise_ratio: float = 1.05, error_burst: int = 3, beta: float = .5):
+        """
+
+        :param interval: seconds of a throughput measure window
+        :param rise_ratio: throughput is considered rising when it's larger than rise_ratio * previous one
+        :param error_burst: number of errors in a window to trigger back off
+        :param beta: multiplicative decrease factor
+        """
+        self.interval = interval
+        self.rise_ratio = rise_ratio
+        self.error_burst = error_burst
+        self.beta = beta
+        # name -> [level, minimum, maximum], order matters for increase
+        self._levels: Dict[str, List[float]] = {}
+        self._semas: Dict[str, weakref.WeakSet] = {}
+        self._saturated = set()
+        self._win_start = time.monotonic()
+        self._win_bytes = 0
+        self._win_errors = 0
+        self._prev_speed: Optional[float] = None
+
+    def add_level(self, name: str, initial: int, minimum: int = 1, maximum: int = None):
+        self._levels[name] = [initial, minimum, maximum or initial * 4]
+        self._semas[name] = weakref.WeakSet()
+
+    def level(self, name: str) -> int:
+        return int(self._levels[name][0])
+
+    def maximum(self, name: str) -> int:
+        return int(self._levels[name][2])
+
+    @property
+    def levels(self) -> Dict[str, int]:
+        """current levels, for logging"""
+        return {name: int(v[0]) for name, v in self._levels.items()}
+
+    def semaphore(self, name: str) -> 'AdaptiveSemaphore':
+        sema = AdaptiveSemaphore(self, name)
+        self._semas[name].add(sema)
+        return sema
+
+    def saturate(self, name: str):
+        """called by semaphore when its limit is reached"""
+        self._saturated.add(name)
+
+    def feed(self, size: int):
+        """account received bytes"""
+        self._win_bytes += size
+        if (t := time.monotonic() - self._win_start) >= self.interval:
+            self._tick(self._win_bytes / t)
+
+    def error(self):
+        """account a stream error, back off immediately when errors burst"""
+        self._win_errors += 1
+        if self._win_errors >= self.error_burst:
+            for v in self._levels.values():
+                if v[0] > v[1]:
+                    v[0] = max(v[1], v[0] * self.beta)
+                    break
+            self._prev_speed = None
+            self._reset_window()
+            logger.debug(f"AIMD back off since error burst, levels: {self.levels}")
+
+    def _tick(self, speed: float):
+        if self._prev_speed is not None and speed > self._prev_speed * self.rise_ratio:
+            for name, v in self._levels.items():
+                if name in self._saturated and v[0] < v[2]:
+                    v[0] = min(v[0] + 1, v[2])
+                    self._wake(name)
+                    logger.debug(f"AIMD increase {name} since throughput rising to {speed:.0f} B/s, "
+                                 f"levels: {self.levels}")
+                    break
+        self._prev_speed = speed
+        self._reset_window()
+
+    def _reset_window(self):
+        self._win_start = time.monotonic()
+        self._win_bytes = 0
+        self._win_errors = 0
+        self._saturated.clear()
+
+    def _wake(self, name: str):
+        for sema in list(self._semas[name]):
+            sema.wake()
+
+
+class AdaptiveSemaphore:
+    """semaphore whose limit follows a level of AIMDController"""
+
+    def __init__(self, controller: AIMDController, name: str):
+        self._controller = controller
+        self._name = name
+        self._active = 0
+        self._waiters: List[asyncio.Future] = []
+
+    @property
+    def limit(self) -> int:
+        return self._controller.level(self._name)
+
+    def locked(self) -> bool:
+        return self._active >= self.limit
+
+    async def acquire(self):
+        while self._active >= self.limit:
+            self._controller.saturate(self._name)
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                self._waiters.remove(fut)
+                if fut.done() and not fut.cancelled():  # woken before cancelled, pass the wakeup on
+                    self.wake()
+                raise
+            self._waiters.remove(fut)
+        self._active += 1
+        if self._active >= self.limit:
+            self._controller.saturate(self._name)
+        return True
+
+    def release(self):
+        self._active -= 1
+        self.wake()
+
+    def wake(self):
+        for fut in self._waiters[:max(self.limit - self._active, 0)]:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
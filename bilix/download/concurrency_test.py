@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from bilix.download.concurrency import AIMDController
+
+
+def test_back_off():
+    ctl = AIMDController(error_burst=2)
+    ctl.add_level('part', 8)
+    ctl.add_level('video', 2)
+    ctl.error()
+    assert ctl.levels == {'part': 8, 'video': 2}
+    ctl.error()
+    assert ctl.levels == {'part': 4, 'video': 2}
+    for _ in range(4):
+        ctl.error()
+    assert ctl.levels == {'part': 1, 'video': 2}
+    ctl.error()
+    ctl.error()
+    assert ctl.levels == {'part': 1, 'video': 1}
+
+
+def test_increase_when_rising_and_saturated():
+    ctl = AIMDController()
+    ctl.add_level('part', 2, maximum=3)
+    ctl.add_level('video', 1)
+    ctl._tick(100.)
+    ctl.saturate('part')
+    ctl._tick(200.)
+    assert ctl.levels == {'part': 3, 'video': 1}
+    ctl.saturate('part')
+    ctl.saturate('video')
+    ctl._tick(300.)  # part reaches maximum
+    assert ctl.levels == {'part': 3, 'video': 2}
+    ctl.saturate('video')
+    ctl._tick(300.)  # not rising
+    assert ctl.levels == {'part': 3, 'video': 2}
+
+
+@pytest.mark.asyncio
+async def test_adaptive_semaphore():
+    ctl = AIMDController()
+    ctl.add_level('part', 1)
+    sema = ctl.semaphore('part')
+    active = []
+
+    async def job():
+        async with sema:
+            active.append(sema._active)
+            await asyncio.sleep(.01)
+
+    tasks = [asyncio.create_task(job()) for _ in range(4)]
+    await asyncio.sleep(0)
+    ctl.saturate('part')
+    ctl._prev_speed = 1.
+    ctl._tick(2.)  # level 1 -> 2, waiters are woken
+    await asyncio.gather(*tasks)
+    assert max(active) == 2
+
+
+@pytest.mark.asyncio
+async def test_adaptive_semaphore_cancel_woken():
+    ctl = AIMDController()
+    ctl.add_level('part', 1)
+    sema = ctl.semaphore('part')
+    await sema.acquire()
+    first = asyncio.create_task(sema.acquire())
+    second = asyncio.create_task(sema.acquire())
+    await asyncio.sleep(0)
+    sema.release()  # first is woken, but cancelled before it runs
+    first.cancel()
+    await asyncio.wait_for(second, 1)  # the wakeup is passed on
+    assert sema._active == 1 and not sema._waiters
@@ -0,0 +1,167 @@
+"""
+in-process dns cache for the transport of downloaders, media hosts are resolved once per ttl
+instead of every time the pool opens a connection
+"""
+import asyncio
+import ipaddress
+import itertools
+import socket
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpcore
+
+from bilix.log import logger
+
+__all__ = ['DNSCache', 'dns_cache', 'CachingBackend']
+
+
+class DNSCache:
+    """host -> resolved addresses with expiry, shared by all event loops of the process"""
+
+    def __init__(self, ttl: float = 300., max_size: int = 1024):
+        """
+
+        :param ttl: seconds to keep resolved addresses
+        :param max_size: max number of hosts, the earliest expired one is dropped when exceeded
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: Dict[Tuple[str, int], Tuple[List[str], float]] = {}
+
+    def get(self, host: str, port: int) -> Optional[List[str]]:
+        if (entry := self._cache.get((host, port))) is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._cache[(host, port)]
+            return None
+        return entry[0]
+
+    def set(self, host: str, port: int, addrs: List[str]):
+        if len(self._cache) >= self.max_size and (host, port) not in self._cache:
+            del self._cache[min(self._cache, key=lambda k: self._cache[k][1])]
+        self._cache[(host, port)] = (addrs, time.monotonic() + self.ttl)
+
+    def demote(self, host: str, port: int, addr: str):
+        """move a failed address to the end, so that later connections try it last"""
+        if (entry := self._cache.get((host, port))) is not None and addr in entry[0]:
+            self._cache[(host, port)] = ([a for a in entry[0] if a != addr] + [addr], entry[1])
+
+    def invalidate(self, host: str, port: int):
+        self._cache.pop((host, port), None)
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        """resolve host to addresses (in the order of getaddrinfo), cached"""
+        if (addrs := self.get(host, port)) is not None:
+            return addrs
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        self.set(host, port, addrs)
+        return addrs
+
+
+dns_cache = DNSCache()
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _interleave(addrs: List[str]) -> List[str]:
+    """alternate address families, starting with the family of the first (preferred) address"""
+    v6 = [addr for addr in addrs if ':' in addr]
+    v4 = [addr for addr in addrs if ':' not in addr]
+    first, second = (v6, v4) if addrs and ':' in addrs[0] else (v4, v6)
+    return [addr for pair in itertools.zip_longest(first, second) for addr in pair if addr is not None]
+
+
+class CachingBackend(httpcore.AsyncNetworkBackend):
+    """
+    network backend connecting to cached addresses of host, TLS still uses the origin host name (SNI).
+    addresses are raced like happy eyeballs (RFC 8305), so that a dead address (such as broken IPv6)
+    only delays the connection by attempt_delay instead of the whole connect timeout.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, cache: DNSCache = dns_cache,
+                 attempt_delay: float = .25):
+        """
+
+        :param backend:
+        :param cache:
+        :param attempt_delay: seconds to wait for an attempt before starting the one to the next address
+        """
+        self._backend = backend
+        self._cache = cache
+        self.attempt_delay = attempt_delay
+        self._resolving: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        if (addrs := self._cache.get(host, port)) is not None:
+            return addrs
+        # concurrent connections to the same host share one lookup
+        if (key := (host, port)) not in self._resolving:
+            self._resolving[key] = asyncio.ensure_future(self._cache.resolve(host, port))
+            self._resolving[key].add_done_callback(lambda _: self._resolving.pop(key, None))
+        return await asyncio.shield(self._resolving[key])
+
+    async def connect_tcp(self, host: str, port: int, timeout: float = None, local_address: str = None,
+                          socket_options: Iterable = None) -> httpcore.AsyncNetworkStream:
+        if _is_ip(host):
+            return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        try:
+            addrs = deque(_interleave(await self._resolve(host, port)))
+        except OSError as e:
+            raise httpcore.ConnectError(e) from e
+        attempts: Dict[asyncio.Future, str] = {}
+        try:
+            while addrs or attempts:
+                if addrs:
+                    addr = addrs.popleft()
+                    attempts[asyncio.ensure_future(
+                        self._backend.connect_tcp(addr, port, timeout, local_address, socket_options))] = addr
+                # the next address is tried once an attempt fails or is slower than attempt_delay
+                done, _ = await asyncio.wait(attempts, timeout=self.attempt_delay if addrs else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                connected = error = None
+                for fut in done:
+                    addr = attempts.pop(fut)
+                    if (e := fut.exception()) is None:
+                        if connected is None:
+                            connected = fut
+                        else:  # closed with the other losers
+                            attempts[fut] = addr
+                    elif isinstance(e, (httpcore.ConnectError, httpcore.ConnectTimeout)):
+                        error = e
+                        self._cache.demote(host, port, addr)
+                        logger.debug(f"connect {host} at {addr} failed, try next address: {e}")
+                    else:
+                        raise e
+                if connected is not None:
+                    return connected.result()
+                if error is not None and not addrs and not attempts:  # addresses may be stale
+                    self._cache.invalidate(host, port)
+                    raise error
+        finally:
+            await self._cancel_attempts(attempts)
+
+    @staticmethod
+    async def _cancel_attempts(attempts: Iterable[asyncio.Future]):
+        """cancel attempts which lost the race, and close the ones connected anyway"""
+        attempts = list(attempts)
+        for fut in attempts:
+            fut.cancel()
+        for res in await asyncio.gather(*attempts, return_exceptions=True):
+            if isinstance(res, httpcore.AsyncNetworkStream):
+                await res.aclose()
+
+    async def connect_unix_socket(self, path: str, timeout: float = None,
+                                  socket_options: Iterable = None) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
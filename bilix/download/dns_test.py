@@ -0,0 +1,69 @@
+import asyncio
+import time
+import httpcore
+import pytest
+from bilix.download.dns import DNSCache, CachingBackend, _interleave
+
+
+class FakeBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self, bad=(), slow=()):
+        self.bad = bad
+        self.slow = slow
+        self.connected = []
+        self.cancelled = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connected.append(host)
+        if host in self.bad:
+            raise httpcore.ConnectError(host)
+        if host in self.slow:  # blackholed address, such as broken IPv6
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled.append(host)
+                raise
+        return host
+
+
+@pytest.mark.asyncio
+async def test_caching_backend():
+    cache = DNSCache()
+    cache.set('media.example.com', 443, ['10.0.0.1', '10.0.0.2'])
+    backend = FakeBackend(bad={'10.0.0.1'})
+    caching = CachingBackend(backend, cache=cache)
+    # failed address is skipped
+    assert await caching.connect_tcp('media.example.com', 443) == '10.0.0.2'
+    assert await caching.connect_tcp('127.0.0.1', 443) == '127.0.0.1'
+    # all addresses failed, cache is invalidated
+    backend.bad = {'10.0.0.1', '10.0.0.2'}
+    with pytest.raises(httpcore.ConnectError):
+        await caching.connect_tcp('media.example.com', 443)
+    assert cache.get('media.example.com', 443) is None
+
+
+@pytest.mark.asyncio
+async def test_caching_backend_race():
+    cache = DNSCache()
+    cache.set('media.example.com', 443, ['2001:db8::1', '2001:db8::2', '10.0.0.1', '10.0.0.2'])
+    backend = FakeBackend(bad={'2001:db8::1'}, slow={'10.0.0.1'})
+    caching = CachingBackend(backend, cache=cache, attempt_delay=.05)
+    a = time.monotonic()
+    # families are interleaved, failed address is skipped at once, slow one is raced after attempt_delay
+    assert await caching.connect_tcp('media.example.com', 443) == '2001:db8::2'
+    assert time.monotonic() - a < 1
+    assert backend.connected == ['2001:db8::1', '10.0.0.1', '2001:db8::2']
+    assert backend.cancelled == ['10.0.0.1']
+    # failed address is tried last next time
+    assert cache.get('media.example.com', 443) == ['2001:db8::2', '10.0.0.1', '10.0.0.2', '2001:db8::1']
+
+
+def test_interleave():
+    assert _interleave(['10.0.0.1', '10.0.0.2', '::1']) == ['10.0.0.1', '::1', '10.0.0.2']
+    assert _interleave(['::1', '::2', '10.0.0.1']) == ['::1', '10.0.0.1', '::2']
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_ttl():
+    cache = DNSCache(ttl=0.)
+    assert '127.0.0.1' in await cache.resolve('localhost', 80)
+    assert cache.get('localhost', 80) is None
@@ -0,0 +1,89 @@
+"""
+total size estimation of segmented media from a few sampled segment sizes
+"""
+import math
+from typing import Dict, Hashable, NamedTuple, Optional
+
+__all__ = ['SizeEstimate', 'SizeEstimator']
+
+
+class SizeEstimate(NamedTuple):
+    total: float
+    low: float  # bounds of the confidence interval
+    high: float
+
+    def __str__(self):
+        if self.low == self.high:
+            return f"{self.total / 1e6:.1f}MB"
+        return f"{self.total / 1e6:.1f}MB ({self.low / 1e6:.1f}-{self.high / 1e6:.1f}MB)"
+
+
+class SizeEstimator:
+    """
+    Estimate total bytes of segments. Sizes known exactly (downloaded, probed or declared by byterange) are summed,
+    the rest is extrapolated by the bytes per second ratio of known segments, with a normal confidence interval
+    of the ratio estimator. Before two sizes are known, the declared bitrate is used with a wide interval.
+    """
+
+    def __init__(self, durations: Dict[Hashable, float], rate: float = None, z: float = 1.96, prior_error: float = .5):
+        """
+
+        :param durations: segment key -> duration in seconds
+        :param rate: declared bytes per second (EXT-X-BITRATE, BANDWIDTH), used before samples
+        :param z: z-score of the confidence interval, 1.96 for 95%
+        :param prior_error: relative error of the interval when extrapolated by less than two samples
+        """
+        self.durations = durations
+        self.rate = rate
+        self.z = z
+        self.prior_error = prior_error
+        self.total_time = sum(durations.values())
+        self._known = set()
+        # running sums for the ratio estimator, segments without duration (init section) are only added to fixed
+        self._fixed = 0
+        self._n = 0
+        self._b = self._t = self._bb = self._bt = self._tt = 0.
+
+    def add(self, key: Hashable, size: int):
+        """record the exact size of a segment, unknown or already recorded keys are ignored"""
+        if key in self._known or (t := self.durations.get(key)) is None:
+            return
+        self._known.add(key)
+        if t <= 0:
+            self._fixed += size
+            return
+        self._n += 1
+        self._b += size
+        self._t += t
+        self._bb += size * size
+        self._bt += size * t
+        self._tt += t * t
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """bytes per second of known segments, None before any sample"""
+        return self._b / self._t if self._n else None
+
+    def __contains__(self, key: Hashable):
+        return key in self._known
+
+    def estimate(self) -> Optional[SizeEstimate]:
+        """None if neither sample nor declared rate is available"""
+        known = self._fixed + self._b
+        rest_t = self.total_time - self._t
+        if rest_t <= 1e-9 or len(self._known) == len(self.durations):
+            return SizeEstimate(known, known, known)
+        if self._n >= 2:
+            ratio = self._b / self._t
+            # sum of squared residuals of size - ratio * duration
+            ssr = max(self._bb - 2 * ratio * self._bt + ratio * ratio * self._tt, 0.)
+            mean_t = self._t / self._n
+            fpc = max(1 - self._n / len(self.durations), 0.)  # finite population correction
+            se = math.sqrt(ssr / (self._n - 1) / self._n * fpc) / mean_t
+            rest, err = ratio * rest_t, self.z * se * rest_t
+        elif self._n == 1 or self.rate:
+            rest = (self._b / self._t if self._n else self.rate) * rest_t
+            err = rest * self.prior_error
+        else:
+            return None
+        return SizeEstimate(known + rest, known + max(rest - err, 0.), known + rest + err)
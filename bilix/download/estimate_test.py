@@ -0,0 +1,30 @@
+import random
+from bilix.download.estimate import SizeEstimator
+
+
+def test_size_estimator():
+    random.seed(0)
+    sizes = {i: int(random.gauss(1e6, 1e5)) for i in range(200)}
+    estimator = SizeEstimator({i: 2. for i in sizes}, rate=1e6)
+    # declared rate before samples
+    estimate = estimator.estimate()
+    assert estimate.total == 200 * 2e6 and estimate.low < estimate.total < estimate.high
+    for i in range(0, 200, 20):
+        estimator.add(i, sizes[i])
+    estimator.add(0, 0)  # recorded already
+    estimator.add(-1, 0)  # unknown key
+    estimate = estimator.estimate()
+    assert estimate.low < sum(sizes.values()) < estimate.high
+    assert estimate.high - estimate.low < .2 * estimate.total
+    for i in sizes:
+        estimator.add(i, sizes[i])
+    estimate = estimator.estimate()
+    assert estimate.total == estimate.low == estimate.high == sum(sizes.values())
+
+
+def test_size_estimator_without_rate():
+    estimator = SizeEstimator({i: 2. for i in range(10)})
+    assert estimator.estimate() is None and estimator.ratio is None
+    estimator.add(0, 100)
+    assert estimator.estimate().total == 1000
+    assert estimator.ratio == 50
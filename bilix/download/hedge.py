@@ -0,0 +1,61 @@
+"""
+hedged requests, a duplicate request is sent for a straggling range or segment and the first one finished wins
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, TypeVar
+
+__all__ = ['HedgeStats', 'hedged']
+
+T = TypeVar('T')
+
+
+class HedgeStats:
+    """counters of hedged requests of a downloader"""
+
+    def __init__(self):
+        self.hedged = 0  # number of hedge requests sent
+        self.won = 0  # number of hedge requests finished before the original one
+        self.wasted = 0  # bytes received but not used because another request of the same content was ahead
+
+    def __str__(self):
+        return f"hedged: {self.hedged}, won: {self.won}, wasted: {self.wasted / 1e6:.2f}MB"
+
+
+async def hedged(start: Callable[[bool], Awaitable[T]], straggling: Callable[[float], bool], stats: HedgeStats,
+                 poll: float = .5) -> T:
+    """
+    run start(False), and start(True) as the hedge if straggling(elapsed seconds) becomes true.
+    the result of the first one finished successfully is returned and the other is cancelled.
+    if one fails, the other is still waited, the error is raised only when all failed.
+
+    :param start: coroutine function to start a request, with a bool param indicates whether it's the hedge
+    :param straggling: checked every poll seconds until the hedge is sent
+    :param stats: hedge counters to update
+    :param poll: interval of straggling check
+    :return:
+    """
+    begin = time.monotonic()
+    primary = asyncio.ensure_future(start(False))
+    hedge = None
+    tasks = {primary}
+    error = None
+    try:
+        while True:
+            done, tasks = await asyncio.wait(tasks, timeout=poll if hedge is None else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        stats.won += 1
+                    return task.result()
+                error = error or task.exception()
+            if not tasks:
+                raise error
+            if hedge is None and straggling(time.monotonic() - begin):
+                hedge = asyncio.ensure_future(start(True))
+                stats.hedged += 1
+                tasks.add(hedge)
+    finally:
+        for task in tasks:
+            task.cancel()
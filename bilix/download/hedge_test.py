@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from bilix.download.hedge import hedged, HedgeStats
+
+
+@pytest.mark.asyncio
+async def test_hedged():
+    stats = HedgeStats()
+    cancelled = []
+
+    async def start(hedge: bool):
+        try:
+            await asyncio.sleep(.05 if hedge else 10)
+        except asyncio.CancelledError:
+            cancelled.append(hedge)
+            raise
+        return hedge
+
+    assert await hedged(start, lambda elapsed: elapsed > .1, stats, poll=.05) is True
+    await asyncio.sleep(0)
+    assert cancelled == [False]
+    assert stats.hedged == 1 and stats.won == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_error():
+    stats = HedgeStats()
+
+    async def start(hedge: bool):
+        if not hedge:
+            await asyncio.sleep(.2)
+            raise ValueError
+        await asyncio.sleep(.3)
+        return 1
+
+    # the hedge is still waited after the original one failed
+    assert await hedged(start, lambda elapsed: True, stats, poll=.05) == 1
+    with pytest.raises(ValueError):
+        await hedged(start, lambda elapsed: False, stats, poll=.05)
@@ -0,0 +1,98 @@
+"""
+compact resume journal of a download, so that restart only needs one read instead of stat every part file
+"""
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bilix.log import logger
+
+__all__ = ['Journal']
+
+
+class Journal:
+    """
+    Resume state of one download, saved as a small json file beside the target.
+
+    total and validator (ETag, Last-Modified...) identify the remote object, ranges are remaining content ranges
+    of a file and segments are completed segment index -> size of a m3u8 video.
+    """
+    version = 1
+
+    def __init__(self, path: Path, total: Optional[int] = None, validator: Dict[str, str] = None):
+        self.path = path
+        self.total = total
+        self.validator = validator or {}
+        self.ranges: List[List[int]] = []
+        self.segments: Dict[int, int] = {}
+        self._lock = threading.Lock()  # save may run in executor
+        self._removed = False
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['Journal']:
+        """load journal from path, return None if not exist or broken"""
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state['version'] != cls.version:
+                return None
+            journal = cls(path, total=state['total'], validator=state['validator'])
+            journal.ranges = [list(r) for r in state['ranges']]
+            journal.segments = {int(idx): size for idx, size in state['segments'].items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.debug(f"journal {path.name} is broken and will be ignored: {e}")
+            return None
+        return journal
+
+    def match(self, total: Optional[int], validator: Dict[str, str]) -> bool:
+        """check whether the remote object is still the one recorded in journal"""
+        if total is not None and self.total is not None and total != self.total:
+            return False
+        for k, v in validator.items():
+            if k in self.validator and self.validator[k] != v:
+                return False
+        return True
+
+    def _state(self) -> dict:
+        return {'version': self.version, 'total': self.total, 'validator': self.validator,
+                'ranges': [list(r) for r in self.ranges], 'segments': dict(self.segments)}
+
+    def _write(self, state: dict, sync_path: Optional[Path]):
+        with self._lock:
+            if self._removed:  # download finished before a delayed save
+                return
+            if sync_path is not None:
+                fd = os.open(sync_path, os.O_RDWR)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def dump(self, sync_path: Path = None):
+        """
+        atomically save journal. if sync_path provided, data of it is flushed to disk first,
+        so that journal never records bytes that are not on disk yet.
+        """
+        self._write(self._state(), sync_path)
+
+    async def save(self, sync_path: Path = None):
+        """same as dump, but the state is snapshot in event loop and disk io is done in executor"""
+        await asyncio.get_running_loop().run_in_executor(None, self._write, self._state(), sync_path)
+
+    def remove(self):
+        with self._lock:
+            self._removed = True
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
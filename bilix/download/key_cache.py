@@ -0,0 +1,58 @@
+"""
+bounded cache of m3u8 decryption keys, so that long-running processes and rotating-key streams keep a flat memory
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable
+
+__all__ = ['KeyCache']
+
+
+class KeyCache:
+    """
+    LRU cache of key uri -> key bytes. Concurrent gets of one uri share a single fetch, a failed or cancelled fetch
+    is dropped so that the next get retries. Keys are cached instead of ciphers since a CBC cipher carries the state
+    of the segment it decrypted.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[bytes]], max_size: int = 64):
+        """
+
+        :param fetch: coroutine function to fetch the key of uri
+        :param max_size: max number of keys, the least recently used one is dropped when exceeded
+        """
+        self.fetch = fetch
+        self.max_size = max_size
+        self._cache: 'OrderedDict[str, asyncio.Future]' = OrderedDict()
+
+    def _get(self, uri: str) -> asyncio.Future:
+        if (fut := self._cache.get(uri)) is not None:
+            self._cache.move_to_end(uri)
+            return fut
+        fut = self._cache[uri] = asyncio.ensure_future(self.fetch(uri))
+        fut.add_done_callback(lambda f: self._done(uri, f))
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return fut
+
+    def _done(self, uri: str, fut: asyncio.Future):
+        # exception is retrieved here, so that a prefetch nobody awaits is not reported as never retrieved
+        if (fut.cancelled() or fut.exception() is not None) and self._cache.get(uri) is fut:
+            del self._cache[uri]
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, uri: str):
+        return uri in self._cache
+
+    async def get(self, uri: str) -> bytes:
+        return await asyncio.shield(self._get(uri))
+
+    def prefetch(self, uris: Iterable[str]):
+        """start fetching keys not cached yet in background, at most max_size ones"""
+        for i, uri in enumerate(dict.fromkeys(uris)):
+            if i >= self.max_size:
+                break
+            if uri not in self._cache:
+                self._get(uri)
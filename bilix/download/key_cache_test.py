@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from bilix.download.key_cache import KeyCache
+
+
+@pytest.mark.asyncio
+async def test_key_cache():
+    fetched = []
+
+    async def fetch(uri: str) -> bytes:
+        fetched.append(uri)
+        await asyncio.sleep(.01)
+        if uri == 'bad':
+            raise ValueError(uri)
+        return uri.encode()
+
+    cache = KeyCache(fetch, max_size=2)
+    cache.prefetch(['a', 'b', 'a', 'c'])
+    await asyncio.sleep(0)
+    assert fetched == ['a', 'b']
+    assert await asyncio.gather(cache.get('a'), cache.get('a')) == [b'a', b'a']
+    assert fetched == ['a', 'b']
+    # b is the least recently used one
+    assert await cache.get('c') == b'c'
+    assert len(cache) == 2 and 'b' not in cache and 'a' in cache
+    with pytest.raises(ValueError):
+        await cache.get('bad')
+    assert 'bad' not in cache
+
+
+@pytest.mark.asyncio
+async def test_key_cache_cancelled():
+    async def fetch(uri: str) -> bytes:
+        await asyncio.sleep(.01)
+        return uri.encode()
+
+    cache = KeyCache(fetch)
+    cache.prefetch(['a'])
+    fut = cache._cache['a']
+    fut.cancel()  # such as the loop of a previous download is shutting down
+    await asyncio.wait([fut])
+    await asyncio.sleep(0)  # done callbacks
+    assert 'a' not in cache
+    assert await cache.get('a') == b'a'
@@ -0,0 +1,81 @@
+"""
+scoring of backup urls (mirrors), mirrors are identified by host so that the score is shared between files
+"""
+import random
+from typing import Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+__all__ = ['Mirrors']
+
+
+class MirrorStat:
+    def __init__(self):
+        self.speed: Optional[float] = None  # EWMA of stream throughput (byte/s)
+        self.latency: Optional[float] = None  # EWMA of time to response headers (s)
+        self.errors: float = 0.  # decayed error count
+        self.active: int = 0  # active stream number
+
+
+class Mirrors:
+    """Throughput, latency and error scoring of mirrors inside a downloader"""
+
+    def __init__(self, max_active: int = 8, alpha: float = .3, switch_ratio: float = .3):
+        """
+
+        :param max_active: soft concurrency cap of each mirror, mirrors under the cap are always preferred
+        :param alpha: smoothing factor of EWMA
+        :param switch_ratio: a stream should switch mirror when its speed is lower than switch_ratio * best speed
+        """
+        self.max_active = max_active
+        self.alpha = alpha
+        self.switch_ratio = switch_ratio
+        self._stats: Dict[str, MirrorStat] = {}
+
+    def stat(self, url: str) -> MirrorStat:
+        key = urlparse(str(url)).netloc
+        if key not in self._stats:
+            self._stats[key] = MirrorStat()
+        return self._stats[key]
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def score(self, url: str) -> float:
+        stat = self.stat(url)
+        if stat.speed is None:  # optimistic for unknown mirror to explore it
+            speed = max((s.speed for s in self._stats.values() if s.speed is not None), default=1.)
+        else:
+            speed = stat.speed
+        return speed / ((1. + stat.errors) * (1. + (stat.latency or 0.)))
+
+    def choose(self, urls: Sequence[str], exclude: int = None) -> int:
+        """choose index of url weighted by score, mirrors reach max_active are only used when no other choice"""
+        candidates = [i for i in range(len(urls)) if i != exclude] or list(range(len(urls)))
+        if len(candidates) == 1:
+            return candidates[0]
+        under_cap = [i for i in candidates if self.stat(urls[i]).active < self.max_active]
+        if not under_cap:
+            return min(candidates, key=lambda i: self.stat(urls[i]).active / self.score(urls[i]))
+        weights = [self.score(urls[i]) for i in under_cap]
+        return random.choices(under_cap, weights=weights)[0]
+
+    def better(self, urls: Sequence[str], idx: int, speed: float) -> Optional[int]:
+        """return index of a mirror much faster than current stream speed, None if current one is good enough"""
+        best = max((i for i in range(len(urls)) if i != idx and self.stat(urls[i]).active < self.max_active),
+                   key=lambda i: self.score(urls[i]), default=None)
+        if best is not None and self.stat(urls[best]).speed is not None and \
+                speed < self.switch_ratio * self.score(urls[best]):
+            return best
+        return None
+
+    def record_latency(self, url: str, latency: float):
+        stat = self.stat(url)
+        stat.latency = self._ewma(stat.latency, latency)
+
+    def record_speed(self, url: str, speed: float):
+        stat = self.stat(url)
+        stat.speed = self._ewma(stat.speed, speed)
+        stat.errors *= .5
+
+    def record_error(self, url: str):
+        self.stat(url).errors += 1.
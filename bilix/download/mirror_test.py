@@ -0,0 +1,33 @@
+from bilix.download.mirror import Mirrors
+
+
+def test_choose_by_score():
+    mirrors = Mirrors()
+    urls = ['https://fast.example.com/a', 'https://slow.example.com/a']
+    mirrors.record_speed(urls[0], 1e7)
+    mirrors.record_speed(urls[1], 1e4)
+    picks = [mirrors.choose(urls) for _ in range(1000)]
+    assert picks.count(0) > 900
+    # exclude current one when retry
+    assert mirrors.choose(urls, exclude=0) == 1
+
+
+def test_active_cap():
+    mirrors = Mirrors(max_active=2)
+    urls = ['https://fast.example.com/a', 'https://slow.example.com/a']
+    mirrors.record_speed(urls[0], 1e7)
+    mirrors.record_speed(urls[1], 1e4)
+    mirrors.stat(urls[0]).active = 2
+    assert mirrors.choose(urls) == 1
+
+
+def test_better():
+    mirrors = Mirrors()
+    urls = ['https://a.example.com/a', 'https://b.example.com/a']
+    assert mirrors.better(urls, 0, 1e3) is None  # no information of b
+    mirrors.record_speed(urls[1], 1e7)
+    assert mirrors.better(urls, 0, 1e3) == 1
+    assert mirrors.better(urls, 0, 1e7) is None
+    mirrors.record_error(urls[1])
+    mirrors.record_error(urls[1])
+    assert mirrors.score(urls[1]) < 1e7
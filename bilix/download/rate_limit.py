@@ -0,0 +1,36 @@
+"""
+async token bucket to limit download rate
+"""
+import asyncio
+import time
+
+__all__ = ['TokenBucket']
+
+
+class TokenBucket:
+    """
+    Async token bucket shared by all streams of a downloader, or by several downloaders in one process.
+
+    Every chunk consumes tokens of its size. When tokens are not enough, the bucket goes into debt and the
+    consumer sleeps until the debt is paid back at the given rate, so concurrent streams are paced smoothly.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+
+        :param rate: download rate (Byte/s)
+        :param burst: max tokens accumulated when idle, default to 0.1s of rate
+        """
+        assert rate > 0
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * .1
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    async def consume(self, size: int):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= size
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
@@ -0,0 +1,32 @@
+import asyncio
+import time
+import pytest
+from bilix.download.rate_limit import TokenBucket
+
+
+async def consume(bucket: TokenBucket, total: int, chunk: int):
+    for _ in range(total // chunk):
+        await bucket.consume(chunk)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('streams, chunk', [(1, 16 * 1024), (30, 16 * 1024), (10, 64 * 1024)])
+async def test_token_bucket_accuracy(streams, chunk):
+    """benchmark of rate accuracy: 1s worth of bytes split by concurrent streams"""
+    rate = 5e6
+    bucket = TokenBucket(rate)
+    total = int(rate) // streams // chunk * chunk
+    a = time.monotonic()
+    await asyncio.gather(*[consume(bucket, total, chunk) for _ in range(streams)])
+    real_rate = (total * streams - bucket.burst) / (time.monotonic() - a)
+    assert abs(real_rate - rate) / rate < .05
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_shared():
+    rate = 2e6
+    bucket = TokenBucket(rate, burst=0)
+    a = time.monotonic()
+    # two consumers (like two downloaders) share one bucket
+    await asyncio.gather(consume(bucket, int(rate) // 4, 8192), consume(bucket, int(rate) // 4, 8192))
+    assert time.monotonic() - a == pytest.approx(.5, rel=.1)
@@ -0,0 +1,32 @@
+"""
+time index of media segments, segments of a time range are found by binary search instead of walking all segments
+"""
+import bisect
+from itertools import accumulate
+from typing import Iterable, List, Tuple
+
+__all__ = ['TimeIndex']
+
+
+class TimeIndex:
+    """cumulative durations of consecutive segments (m3u8 segments, sidx references...)"""
+
+    def __init__(self, durations: Iterable[float]):
+        self.ends: List[float] = list(accumulate(durations))  # end time of each segment
+
+    def __len__(self):
+        return len(self.ends)
+
+    @property
+    def duration(self) -> float:
+        return self.ends[-1] if self.ends else 0.
+
+    def start_of(self, idx: int) -> float:
+        """start time of segment idx"""
+        return self.ends[idx - 1] if idx > 0 else 0.
+
+    def locate(self, start: float, end: float) -> Tuple[int, int]:
+        """[first, last) indexes of segments overlapping time range [start, end), empty if first == last"""
+        first = bisect.bisect_right(self.ends, start)
+        last = min(bisect.bisect_left(self.ends, end) + 1, len(self.ends))
+        return first, max(first, last)
@@ -0,0 +1,11 @@
+from bilix.download.time_index import TimeIndex
+
+
+def test_time_index():
+    index = TimeIndex([10, 10, 10])
+    assert index.duration == 30 and len(index) == 3
+    assert index.locate(5, 25) == (0, 3)
+    assert index.locate(10, 20) == (1, 2)
+    assert index.locate(12, 15) == (1, 2)
+    assert index.locate(35, 40) == (3, 3)
+    assert index.start_of(0) == 0 and index.start_of(2) == 20
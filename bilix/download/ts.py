@@ -0,0 +1,74 @@
+"""
+in-process MPEG-TS joining, segments of a playlist are appended into one transport stream without ffmpeg
+"""
+from typing import Dict
+
+__all__ = ['TS_PACKET_SIZE', 'TSJoiner']
+
+TS_PACKET_SIZE = 188
+_SYNC = 0x47
+_NULL_PID = 0x1FFF
+
+
+class TSJoiner:
+    """
+    Join MPEG-TS segments into one stream. Every segment is aligned to packet sync bytes (leading junk and trailing
+    partial packets are dropped), and continuity counters of every PID are shifted to continue the previous segment,
+    so that demuxers don't see a discontinuity at every segment boundary.
+    """
+
+    def __init__(self):
+        self._cc: Dict[int, int] = {}  # pid -> continuity counter of the last packet with payload
+        self.dropped = 0  # bytes dropped out of sync
+
+    def _align(self, data: bytes) -> bytes:
+        n = len(data)
+        count = n // TS_PACKET_SIZE
+        if n % TS_PACKET_SIZE == 0 and data[::TS_PACKET_SIZE] == bytes([_SYNC]) * count:
+            return data
+        out = bytearray()
+        i = 0
+        while i + TS_PACKET_SIZE <= n:
+            # a packet is in sync if the next one also starts with sync byte (or there is no next full packet)
+            if data[i] == _SYNC and (i + 2 * TS_PACKET_SIZE > n or data[i + TS_PACKET_SIZE] == _SYNC):
+                out += data[i:i + TS_PACKET_SIZE]
+                i += TS_PACKET_SIZE
+                continue
+            j = data.find(_SYNC, i + 1)
+            if j < 0:
+                break
+            self.dropped += j - i
+            i = j
+        self.dropped += n - i
+        return bytes(out)
+
+    def feed(self, data: bytes) -> bytes:
+        """return packets of segment data to be appended to the joined stream"""
+        data = self._align(data)
+        buf = None
+        deltas: Dict[int, int] = {}
+        hdr1, hdr2, hdr3 = data[1::TS_PACKET_SIZE], data[2::TS_PACKET_SIZE], data[3::TS_PACKET_SIZE]
+        for k, b3 in enumerate(hdr3):
+            if not b3 & 0x10:  # counter is not incremented by packet without payload
+                continue
+            pid = (hdr1[k] & 0x1F) << 8 | hdr2[k]
+            if pid == _NULL_PID:
+                continue
+            cc = b3 & 0x0F
+            if (delta := deltas.get(pid)) is None:  # first packet of pid in segment decides the shift
+                last = self._cc.get(pid)
+                delta = deltas[pid] = 0 if last is None else (last + 1 - cc) & 0x0F
+            if delta:
+                if buf is None:
+                    buf = bytearray(data)
+                cc = (cc + delta) & 0x0F
+                buf[k * TS_PACKET_SIZE + 3] = (b3 & 0xF0) | cc
+            self._cc[pid] = cc
+        return data if buf is None else bytes(buf)
+
+    def resume(self, tail: bytes):
+        """restore counters from the tail (packet aligned) of a stream joined before"""
+        self._cc.clear()
+        dropped = self.dropped
+        self.feed(tail)
+        self.dropped = dropped
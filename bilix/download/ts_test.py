@@ -0,0 +1,29 @@
+import os
+from bilix.download.ts import TSJoiner
+
+
+def packet(pid: int, cc: int, payload: bool = True) -> bytes:
+    return bytes([0x47, pid >> 8, pid & 0xFF, (0x10 if payload else 0x20) | cc]) + os.urandom(184)
+
+
+def counters(data: bytes, pid: int):
+    return [data[i + 3] & 0x0F for i in range(0, len(data), 188) if (data[i + 1] & 0x1F) << 8 | data[i + 2] == pid]
+
+
+def test_ts_joiner():
+    joiner = TSJoiner()
+    seg1 = b''.join(packet(0x100, cc) for cc in range(14, 16)) + packet(0x101, 3)
+    assert joiner.feed(seg1) == seg1
+    # counters restart, leading junk and trailing partial packet
+    seg2 = b'junk' + packet(0x100, 0) + packet(0x100, 0, payload=False) + packet(0x100, 1) + packet(0x101, 4) + \
+        b'\x47partial'
+    out = joiner.feed(seg2)
+    assert len(out) == 4 * 188 and joiner.dropped == 4 + 8
+    assert counters(out, 0x100) == [0, 0, 1]  # 15 -> 0 continues, packet without payload is untouched
+    assert counters(out, 0x101) == [4]
+    seg3 = packet(0x100, 7) + packet(0x100, 8)
+    assert counters(joiner.feed(seg3), 0x100) == [2, 3]
+    # restored from the tail of joined stream
+    resumed = TSJoiner()
+    resumed.resume(seg1 + out)
+    assert counters(resumed.feed(seg3), 0x100) == [2, 3]
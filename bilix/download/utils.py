@@ -1,49 +1,148 @@
 import asyncio
+import ctypes
 import errno
 import os
 import random
+import sys
+import time
 from functools import wraps
 from pathlib import Path
 
-import aiofiles
 import httpx
 from typing import Union, Sequence, Tuple, List
 from bilix.exception import APIError, APIParseError
 from bilix.log import logger
+from bilix.download.mirror import Mirrors
 
 
-async def merge_files(file_list: List[Path], new_path: Path):
+def append_file(fdst, fsrc, buffer_size: int = 1024 * 1024, offset: int = 0, size: int = None):
+    """
+    append content of fsrc (size bytes from offset, or to the end) to the current position of fdst,
+    copy in kernel by copy_file_range or sendfile when possible, otherwise fall back to a bounded buffer copy.
+    both files should be opened unbuffered (buffering=0), and fdst should not be opened in append mode.
+    """
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    end = os.fstat(in_fd).st_size if size is None else offset + size
+    pos = offset
+    try:
+        if hasattr(os, 'copy_file_range'):
+            while pos < end and (n := os.copy_file_range(in_fd, out_fd, min(end - pos, 1 << 30), pos)):
+                pos += n
+        elif hasattr(os, 'sendfile'):
+            while pos < end and (n := os.sendfile(out_fd, in_fd, pos, min(end - pos, 1 << 30))):
+                pos += n
+    except OSError as e:  # not supported between these files, e.g. cross file system in old kernel
+        # position of fdst has been moved along with copied bytes, so just continue with buffer copy
+        logger.debug(f"zero-copy failed at {pos}, fall back to buffer copy: {e}")
+    fsrc.seek(pos)
+    while pos < end and (buf := fsrc.read(min(buffer_size, end - pos))):
+        fdst.write(buf)
+        pos += len(buf)
+
+
+def _merge_files(file_list: List[Path], new_path: Path):
     first_file = file_list[0]
-    async with aiofiles.open(first_file, 'ab') as f:
+    with open(first_file, 'r+b', buffering=0) as f:
+        f.seek(0, os.SEEK_END)
         for idx in range(1, len(file_list)):
-            async with aiofiles.open(file_list[idx], 'rb') as fa:
-                await f.write(await fa.read())
+            with open(file_list[idx], 'rb', buffering=0) as fa:
+                append_file(f, fa)
             os.remove(file_list[idx])
     os.rename(first_file, new_path)
 
 
+async def merge_files(file_list: List[Path], new_path: Path):
+    """append files to the first one in executor, peak memory is constant regardless of file size"""
+    await asyncio.get_running_loop().run_in_executor(None, _merge_files, file_list, new_path)
+
+
+def _load_fallocate():
+    """fallocate(2) of libc on linux, which fails with EOPNOTSUPP instead of writing blocks like posix_fallocate"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    for name in ('fallocate64', 'fallocate'):
+        if (func := getattr(libc, name, None)) is not None:
+            func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+            func.restype = ctypes.c_int
+            return func
+    return None
+
+
+_fallocate = _load_fallocate()
+
+
+def _native_allocate(fd: int, size: int) -> bool:
+    """reserve blocks by the file system, False if it can't be done without writing every block"""
+    if _fallocate is not None:
+        if _fallocate(fd, 0, 0, size) == 0:
+            return True
+        logger.debug(f"fallocate failed, use sparse file instead: {os.strerror(ctypes.get_errno())}")
+        return False
+    # glibc emulates posix_fallocate by writing blocks, it's only tried where native (such as FreeBSD)
+    if hasattr(os, 'posix_fallocate') and not sys.platform.startswith('linux'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return True
+        except OSError as e:  # not supported by file system
+            logger.debug(f"posix_fallocate failed, use sparse file instead: {e}")
+    return False
+
+
+def preallocate(path: Path, size: int):
+    """
+    create file with given size, disk space is reserved in advance if the file system supports it natively,
+    otherwise fall back to a sparse file (never by writing zeros, which parts would write again)
+
+    :param path: file path
+    :param size: file size in bytes
+    """
+    with open(path, 'wb') as f:
+        if size <= 0:
+            return
+        if not _native_allocate(f.fileno(), size):
+            os.ftruncate(f.fileno(), size)
+
+
 async def req_retry(client: httpx.AsyncClient, url_or_urls: Union[str, Sequence[str]], method='GET',
-                    follow_redirects=False, retry=5, **kwargs) -> httpx.Response:
-    """Client request with multiple backup urls and retry"""
+                    follow_redirects=False, retry=5, mirrors: Mirrors = None, **kwargs) -> httpx.Response:
+    """Client request with multiple backup urls and retry, backup url is chosen by score if mirrors provided"""
     pre_exc = None  # predefine to avoid warning
+    idx = None
     for times in range(1 + retry):
-        url = url_or_urls if type(url_or_urls) is str else random.choice(url_or_urls)
+        if type(url_or_urls) is str:
+            url = url_or_urls
+        elif mirrors:  # the mirror failed last time is left if there is another one
+            idx = mirrors.choose(url_or_urls, exclude=idx)
+            url = url_or_urls[idx]
+        else:
+            url = random.choice(url_or_urls)
         try:
+            a = time.monotonic()
             res = await client.request(method, url, follow_redirects=follow_redirects, **kwargs)
             res.raise_for_status()
         except httpx.TransportError as e:
             msg = f'{method} {e.__class__.__name__} url: {url}'
             logger.warning(msg) if times > 0 else logger.debug(msg)
             pre_exc = e
+            if mirrors:
+                mirrors.record_error(url)
             await asyncio.sleep(.1 * (times + 1))
         except httpx.HTTPStatusError as e:
             logger.warning(f'{method} {e.response.status_code} {url}')
             pre_exc = e
+            if mirrors:
+                mirrors.record_error(url)
             await asyncio.sleep(1. * (times + 1))
         except Exception as e:
             logger.warning(f'{method} {e.__class__.__name__} 未知异常 url: {url}')
             raise e
         else:
+            if mirrors:
+                mirrors.record_latency(url, time.monotonic() - a)
             return res
     logger.error(f"{method} 超过重复次数 {url_or_urls}")
     raise pre_exc
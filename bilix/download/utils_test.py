@@ -0,0 +1,57 @@
+import os
+import sys
+import pytest
+from unittest import mock
+from bilix.download.utils import merge_files, append_file, preallocate
+
+
+@pytest.mark.asyncio
+async def test_merge_files(tmp_path):
+    contents = [os.urandom(n) for n in (0, 1, 4096, 3 * 1024 * 1024 + 5)]
+    file_list = []
+    for i, content in enumerate(contents):
+        (p := tmp_path / f'{i}').write_bytes(content)
+        file_list.append(p)
+    await merge_files(file_list, tmp_path / 'merged')
+    assert (tmp_path / 'merged').read_bytes() == b''.join(contents)
+    assert os.listdir(tmp_path) == ['merged']
+
+
+def test_append_file_fallback(tmp_path):
+    (src := tmp_path / 'src').write_bytes(content := os.urandom(1024 * 1024 + 3))
+    (dst := tmp_path / 'dst').write_bytes(b'head')
+
+    def broken_copy(in_fd, out_fd, count, offset_src=None):
+        # copy a part and then fail, like copy_file_range across file system
+        if offset_src:
+            raise OSError(18, 'Invalid cross-device link')
+        return os.write(out_fd, os.pread(in_fd, 1000, 0))
+
+    with open(dst, 'r+b', buffering=0) as fdst, open(src, 'rb', buffering=0) as fsrc, \
+            mock.patch('os.copy_file_range', broken_copy, create=True):
+        fdst.seek(0, os.SEEK_END)
+        append_file(fdst, fsrc, buffer_size=4096)
+    assert dst.read_bytes() == b'head' + content
+
+
+def test_append_file_range(tmp_path):
+    (src := tmp_path / 'src').write_bytes(content := os.urandom(10000))
+    with open(tmp_path / 'dst', 'wb', buffering=0) as fdst, open(src, 'rb', buffering=0) as fsrc:
+        append_file(fdst, fsrc, offset=100, size=5000)
+        append_file(fdst, fsrc, offset=9000)
+    assert (tmp_path / 'dst').read_bytes() == content[100:5100] + content[9000:]
+
+
+def test_preallocate(tmp_path, monkeypatch):
+    preallocate(tmp_path / 'f', 1000000)
+    assert os.path.getsize(tmp_path / 'f') == 1000000
+
+    # without native allocation the file is sparse, blocks are never written by emulation
+    def emulated(*args):
+        raise AssertionError('posix_fallocate should not be called')
+
+    monkeypatch.setattr('bilix.download.utils._fallocate', None)
+    monkeypatch.setattr(os, 'posix_fallocate', emulated, raising=False)
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    preallocate(tmp_path / 'g', 1000000)
+    assert os.path.getsize(tmp_path / 'g') == 1000000
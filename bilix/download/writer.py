@@ -0,0 +1,327 @@
+"""
+dedicated disk writer, stream workers hand buffers to it instead of a thread-pool hop per chunk
+"""
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Sequence, Tuple
+
+__all__ = ['DiskWriter', 'WriteHandle', 'OrderedWriter', 'PipeHandle']
+
+
+def _pwrite(fd: int, buf: memoryview, offset: int, lock: threading.Lock) -> int:
+    """os.pwrite, or seek and write under the lock of fd where pwrite is not available (Windows)"""
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, buf, offset)
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.write(fd, buf)
+
+
+class DiskWriter:
+    """
+    Write buffers of stream workers in a few dedicated threads.
+
+    Buffers of a file are queued in order and written by one thread at a time, contiguous small buffers are
+    coalesced into one large write. When buffered bytes exceed max_buffer, writers wait until the disk catches up,
+    so that network readers are slowed down instead of filling the memory.
+    """
+
+    def __init__(self, threads: int = 2, max_buffer: int = 64 * 1024 * 1024, coalesce_size: int = 4 * 1024 * 1024):
+        """
+
+        :param threads: number of writer threads
+        :param max_buffer: max bytes queued but not written yet (backpressure bound)
+        :param coalesce_size: max bytes of a coalesced write
+        """
+        self.threads = threads
+        self.max_buffer = max_buffer
+        self.coalesce_size = coalesce_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._buffered = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def open(self, path: Path, append: bool = False) -> 'WriteHandle':
+        """open path for writing, if append, buffers without offset are written at the end of file"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='bilix-writer')
+        return WriteHandle(self, path, append)
+
+    async def aclose(self):
+        """shut down writer threads, handles should be closed before"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def _reserve(self, size: int):
+        # a single buffer larger than max_buffer is allowed when nothing is buffered
+        while self._buffered and self._buffered + size > self.max_buffer:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            finally:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+        self._buffered += size
+
+    def _release(self, size: int):
+        self._buffered -= size
+        while self._waiters and self._buffered < self.max_buffer:
+            if not (fut := self._waiters.popleft()).done():
+                fut.set_result(None)
+
+
+class WriteHandle:
+    """a file opened by DiskWriter"""
+
+    def __init__(self, writer: DiskWriter, path: Path, append: bool):
+        self.writer = writer
+        self.path = path
+        self._loop = asyncio.get_running_loop()
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        self._end = os.fstat(self._fd).st_size if append else 0
+        self._queue: Deque[Tuple[int, bytes]] = deque()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()  # seek and write of fd without pwrite
+        self._running = False
+        self._unwritten = 0  # buffers not written yet, only changed in event loop
+        self._flush_waiters: List[asyncio.Future] = []
+        self.error: Optional[BaseException] = None
+        self._closed = False
+
+    async def write(self, data: bytes, offset: int = None):
+        """queue data to be written at offset (at the end of previous write if None), wait if too much is queued"""
+        if self.error:
+            raise self.error
+        if not data:
+            return
+        if offset is None:
+            offset = self._end
+        self._end = offset + len(data)
+        await self.writer._reserve(len(data))
+        self._unwritten += 1
+        with self._cond:
+            self._queue.append((offset, data))
+            if not self._running:
+                self._running = True
+                self.writer._executor.submit(self._drain)
+
+    def _drain(self):
+        """run in writer thread until queue is empty"""
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._running = False
+                    self._cond.notify_all()
+                    return
+                offset, data = self._queue.popleft()
+                bufs, end, count = [data], offset + len(data), 1
+                # coalesce following contiguous buffers
+                while self._queue and self._queue[0][0] == end and end - offset < self.writer.coalesce_size:
+                    _, data = self._queue.popleft()
+                    bufs.append(data)
+                    end += len(data)
+                    count += 1
+            try:
+                if self.error is None:
+                    buf = memoryview(b''.join(bufs) if count > 1 else bufs[0])
+                    while buf:
+                        n = _pwrite(self._fd, buf, offset, self._lock)
+                        buf, offset = buf[n:], offset + n
+            except Exception as e:  # raised to the coroutine awaiting flush or the next write
+                self.error = e
+            finally:
+                try:
+                    self._loop.call_soon_threadsafe(self._written, count, sum(len(b) for b in bufs))
+                except RuntimeError:  # event loop is closed, nobody is waiting
+                    pass
+
+    def _written(self, count: int, size: int):
+        self._unwritten -= count
+        self.writer._release(size)
+        if not self._unwritten:
+            for fut in self._flush_waiters:
+                if not fut.done():
+                    fut.set_result(None)
+            self._flush_waiters.clear()
+
+    async def flush(self):
+        """wait until all queued data is written to OS, raise the error of writing if any"""
+        if self._unwritten:
+            fut = self._loop.create_future()
+            self._flush_waiters.append(fut)
+            await fut
+        if self.error:
+            raise self.error
+
+    def flush_sync(self):
+        """block until all queued data is written, used when event loop can not be awaited (such as cancelled)"""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._running)
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            self.close_sync()
+
+    def close_sync(self):
+        self.flush_sync()
+        if not self._closed:
+            self._closed = True
+            os.close(self._fd)
+
+
+class OrderedWriter:
+    """
+    Write buffers of a sequence of keys (such as segments) into a file in order, through a bounded reorder buffer.
+    Buffers finished out of order wait in memory until their turn, and producers of keys too far ahead of
+    the written position wait in reserve, so at most window buffers are kept in memory.
+    """
+
+    def __init__(self, handle: WriteHandle, keys: Sequence[Hashable], window: int, written: Dict = None,
+                 transform: Callable[[bytes], bytes] = None):
+        """
+
+        :param handle: file to write, buffers are appended
+        :param keys: keys in writing order
+        :param window: max number of keys ahead of the written position
+        :param written: key -> size of keys already in file (resume), only the leading keys of sequence are skipped
+        :param transform: applied to buffers in writing order before written, such as joining stream packets
+        """
+        self.handle = handle
+        self.window = window
+        self.transform = transform
+        self._keys = list(keys)
+        self._pos = {k: i for i, k in enumerate(self._keys)}
+        self.written: Dict[Hashable, int] = {}
+        self._next = 0
+        while written and self._next < len(self._keys) and self._keys[self._next] in written:
+            self.written[self._keys[self._next]] = written[self._keys[self._next]]
+            self._next += 1
+        self._buffer: Dict[int, bytes] = {}
+        self._cond = asyncio.Condition()
+        self._draining = False
+
+    @property
+    def size(self) -> int:
+        """bytes written (or queued to disk writer)"""
+        return sum(self.written.values())
+
+    async def reserve(self, key: Hashable):
+        """wait until key is inside the window, call it before producing the buffer of key"""
+        pos = self._pos[key]
+        async with self._cond:
+            await self._cond.wait_for(lambda: pos < self._next + self.window)
+
+    async def put(self, key: Hashable, data: bytes):
+        self._buffer[self._pos[key]] = data
+        if self._draining:  # the draining one will write it in turn
+            return
+        self._draining = True
+        try:
+            while (pos := self._next) in self._buffer:
+                data = self._buffer.pop(pos)
+                if self.transform:
+                    data = self.transform(data)
+                await self.handle.write(data)
+                self.written[self._keys[pos]] = len(data)
+                self._next += 1
+                async with self._cond:
+                    self._cond.notify_all()
+        finally:
+            self._draining = False
+
+
+class PipeHandle:
+    """
+    A pipe (fifo) written like a WriteHandle by concurrent range streams. Bytes are sent to the pipe in offset order,
+    buffers ahead of the pipe position wait in memory, and writers more than window bytes ahead wait until the reader
+    catches up. Bytes behind the pipe position (written twice) are dropped.
+    A pipe blocks until its reader takes the bytes, so it's opened and written by a thread of its own, instead of
+    holding threads shared by other work.
+    """
+
+    def __init__(self, path: Path, window: int):
+        self.path = path
+        self.window = window
+        self._fd: Optional[int] = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='bilix-pipe')
+        self._loop = asyncio.get_running_loop()
+        self._pos = 0  # bytes sent to pipe
+        self._end = 0
+        self._buffer: Dict[int, bytes] = {}
+        self._cond = asyncio.Condition()
+        self._draining = False
+        self.error: Optional[BaseException] = None
+
+    async def open(self):
+        """wait until the reader opens the pipe"""
+        self._fd = await self._loop.run_in_executor(self._executor, os.open, self.path, os.O_WRONLY)
+
+    @property
+    def position(self) -> int:
+        return self._pos
+
+    def _send(self, data: bytes):
+        buf = memoryview(data)
+        while buf:
+            buf = buf[os.write(self._fd, buf):]
+
+    async def write(self, data: bytes, offset: int = None):
+        if offset is None:
+            offset = self._end
+        self._end = offset + len(data)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.error or offset < self._pos + self.window)
+        if self.error:
+            raise self.error
+        if offset + len(data) <= self._pos:
+            return
+        if len(self._buffer.get(offset, b'')) < len(data):
+            self._buffer[offset] = data
+        if self._draining:  # the draining one will send it in turn
+            return
+        self._draining = True
+        try:
+            while ready := sorted(o for o in self._buffer if o <= self._pos):
+                bufs, pos = [], self._pos
+                for o in ready:
+                    data = self._buffer.pop(o)
+                    if o + len(data) > pos:
+                        bufs.append(data[pos - o:])
+                        pos = o + len(data)
+                await self._loop.run_in_executor(self._executor, self._send, b''.join(bufs))
+                self._pos = pos
+                async with self._cond:
+                    self._cond.notify_all()
+        except OSError as e:  # reader is gone
+            self.error = e
+            async with self._cond:
+                self._cond.notify_all()
+            raise
+        finally:
+            self._draining = False
+
+    async def flush(self):
+        if self.error:
+            raise self.error
+
+    async def close(self):
+        try:
+            if self._buffer and not self.error:
+                raise ValueError(f"{self.path.name} closed with bytes not sent after {self._pos}")
+            await self.flush()
+        finally:
+            self.close_sync()
+
+    def close_sync(self):
+        # the thread may still wait for the reader to open or read the pipe, it ends when the reader is gone
+        self._executor.shutdown(wait=False)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
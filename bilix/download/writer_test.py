@@ -0,0 +1,107 @@
+import asyncio
+import os
+import pytest
+from bilix.download.writer import DiskWriter, OrderedWriter, PipeHandle
+
+
+@pytest.mark.asyncio
+async def test_disk_writer(tmp_path):
+    data = os.urandom(1024 * 1024)
+    writer = DiskWriter(max_buffer=64 * 1024, coalesce_size=256 * 1024)
+    handle = writer.open(tmp_path / 'f')
+
+    async def write_range(start, end):
+        for i in range(start, end, 1000):
+            await handle.write(data[i:min(i + 1000, end)], i)
+            # backpressure bounds buffered bytes
+            assert writer._buffered <= writer.max_buffer
+
+    mid = len(data) // 2
+    await asyncio.gather(write_range(0, mid), write_range(mid, len(data)))
+    await handle.close()
+    assert (tmp_path / 'f').read_bytes() == data
+    assert writer._buffered == 0
+
+
+@pytest.mark.asyncio
+async def test_disk_writer_without_pwrite(tmp_path, monkeypatch):
+    monkeypatch.delattr(os, 'pwrite', raising=False)
+    data = os.urandom(100000)
+    writer = DiskWriter(coalesce_size=1000)
+    handle = writer.open(tmp_path / 'f')
+    await asyncio.gather(*[handle.write(data[i:i + 1000], i) for i in reversed(range(0, len(data), 1000))])
+    await handle.close()
+    await writer.aclose()
+    assert (tmp_path / 'f').read_bytes() == data
+    assert writer._executor is None
+
+
+@pytest.mark.asyncio
+async def test_disk_writer_error(tmp_path, monkeypatch):
+    def broken(*args):
+        raise ValueError('broken')
+
+    monkeypatch.setattr('bilix.download.writer._pwrite', broken)
+    writer = DiskWriter()
+    handle = writer.open(tmp_path / 'f')
+    await handle.write(b'abc')
+    # error of writer thread is raised instead of waiting forever
+    with pytest.raises(ValueError, match='broken'):
+        await asyncio.wait_for(handle.close(), 5)
+    await writer.aclose()
+    assert writer._buffered == 0
+
+
+@pytest.mark.asyncio
+async def test_disk_writer_append(tmp_path):
+    (tmp_path / 'f').write_bytes(b'abc')
+    handle = DiskWriter().open(tmp_path / 'f', append=True)
+    await handle.write(b'def')
+    await handle.write(b'ghi')
+    await handle.close()
+    assert (tmp_path / 'f').read_bytes() == b'abcdefghi'
+
+
+@pytest.mark.asyncio
+async def test_ordered_writer(tmp_path):
+    bufs = [os.urandom(100 + i) for i in range(20)]
+    handle = DiskWriter().open(tmp_path / 'f', append=True)
+    writer = OrderedWriter(handle, keys=list(range(20)), window=4)
+    ahead = []
+
+    async def produce(i):
+        await writer.reserve(i)
+        ahead.append(len(writer._buffer))
+        # later keys finish earlier
+        await asyncio.sleep(.01 * (4 - i % 4))
+        await writer.put(i, bufs[i])
+
+    await asyncio.gather(*[produce(i) for i in reversed(range(20))])
+    await handle.close()
+    assert (tmp_path / 'f').read_bytes() == b''.join(bufs)
+    assert max(ahead) < writer.window
+    assert writer.written == {i: len(bufs[i]) for i in range(20)}
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='fifo not supported')
+async def test_pipe_handle(tmp_path):
+    data = os.urandom(10000)
+    os.mkfifo(tmp_path / 'fifo')
+    loop = asyncio.get_running_loop()
+    read = loop.run_in_executor(None, (tmp_path / 'fifo').read_bytes)
+    handle = PipeHandle(tmp_path / 'fifo', window=2000)
+    await handle.open()
+    buffered = []
+
+    async def stream(start, end):
+        for pos in range(start, end, 100):
+            await handle.write(data[pos:min(pos + 100, end)], pos)
+            buffered.append(sum(map(len, handle._buffer.values())))
+            await asyncio.sleep(.001)
+
+    # streams of later ranges start first, and a range is written twice
+    await asyncio.gather(*[stream(i * 1000, (i + 1) * 1000) for i in reversed(range(10))], stream(0, 1500))
+    await handle.close()
+    assert await read == data
+    assert max(buffered) <= handle.window + 100
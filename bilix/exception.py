@@ -45,3 +45,18 @@ class HandleMethodError(HandleError):
 
     def __str__(self):
         return f"For {self.executor_cls.__name__} method '{self.method}' is not available"
+
+
+class RemoteChangedError(Exception):
+    """remote file is not the one expected (changed since last download, or wrong size hint)"""
+
+
+class FFmpegError(Exception):
+    """ffmpeg exited with non-zero code"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def __str__(self):
+        stderr = self.job.stderr.strip()[-500:]
+        return f"ffmpeg exited with code {self.job.returncode}: {stderr or ' '.join(self.job.cmd)}"
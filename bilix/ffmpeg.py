@@ -1,22 +1,140 @@
 """
 just some useful ffmpeg commands wrapped in python
 """
+import asyncio
+import heapq
+import itertools
 import os
-from anyio import run_process
-from typing import List
+import time
+from collections import deque
+from typing import Deque, List, NamedTuple, Sequence
 from pathlib import Path
 import tempfile
+from bilix.exception import FFmpegError
+from bilix.log import logger
+
+__all__ = ['PRIORITY_MERGE', 'PRIORITY_CLIP', 'FFmpegJob', 'FFmpegPool', 'pool', 'concat', 'combine',
+           'time_range_clip', 'mux']
+
+# lower runs first, merges finish downloaded videos and free their parts, so they go before clips
+PRIORITY_MERGE = 0
+PRIORITY_CLIP = 1
+
+
+class FFmpegJob(NamedTuple):
+    cmd: Sequence[str]
+    priority: int
+    wait: float  # seconds queued before a worker is free
+    run: float  # seconds of the process
+    returncode: int
+    stderr: str
+
+
+class FFmpegPool:
+    """
+    Run ffmpeg processes with at most max_workers at once, queued jobs are started by priority then in order.
+    Finished jobs are kept in history (bounded) with their queueing and running time for tuning.
+    """
+
+    def __init__(self, max_workers: int = 2, history: int = 100):
+        self._max_workers = max_workers
+        self._running = 0
+        self._queue = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.history: Deque[FFmpegJob] = deque(maxlen=history)
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, value: int):
+        self._max_workers = max(value, 1)
+        self._wake()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def pending(self) -> int:
+        return sum(not fut.done() for _, _, fut in self._queue)
+
+    def _wake(self):
+        while self._queue and self._running < self._max_workers:
+            _, _, fut = heapq.heappop(self._queue)
+            if not fut.done():  # cancelled waiters are dropped
+                self._running += 1
+                fut.set_result(None)
+
+    def _release(self):
+        self._running -= 1
+        self._wake()
+
+    async def _acquire(self, priority: int):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), fut))
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():  # worker was given before cancelled, pass it on
+                self._release()
+            raise
+
+    async def run(self, cmd: Sequence[str], priority: int = PRIORITY_MERGE, bounded: bool = True,
+                  started: asyncio.Event = None) -> FFmpegJob:
+        """
+        run cmd when a worker is free, raise FFmpegError with captured stderr if it exits with non-zero code
+
+        :param cmd:
+        :param priority: lower is started first
+        :param bounded: wait for a worker, unbounded jobs start at once and are only recorded in history
+        :param started: set once the process is running
+        """
+        queued_at = time.monotonic()
+        if bounded:
+            await self._acquire(priority)
+        started_at = time.monotonic()
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                        stdout=asyncio.subprocess.DEVNULL,
+                                                        stderr=asyncio.subprocess.PIPE)
+            if started:
+                started.set()
+            try:
+                _, stderr = await proc.communicate()
+            except BaseException:  # cancelled
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                raise
+        finally:
+            if bounded:
+                self._release()
+        job = FFmpegJob(cmd=cmd, priority=priority, wait=started_at - queued_at, run=time.monotonic() - started_at,
+                        returncode=proc.returncode, stderr=stderr.decode(errors='replace'))
+        self.history.append(job)
+        logger.debug(f"ffmpeg exit {job.returncode} waited {job.wait:.2f}s ran {job.run:.2f}s: {cmd[-1]}")
+        if job.returncode:
+            raise FFmpegError(job)
+        return job
+
+
+pool = FFmpegPool()
 
 
 async def concat(path_lst: List[Path], output_path: Path, remove=True):
     with tempfile.NamedTemporaryFile('w', dir=output_path.parent, delete=False) as fp:
         for path in path_lst:
             fp.write(f"file '{path.name}'\n")
-        cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', fp.name, '-c', 'copy', '-loglevel', 'quiet',
+        cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', fp.name, '-c', 'copy', '-loglevel', 'error',
                str(output_path)]
         # print(' '.join(map(lambda x: f'"{x}"', cmd)))
-    await run_process(cmd)
-    os.remove(fp.name)
+    try:
+        await pool.run(cmd, priority=PRIORITY_MERGE)
+    finally:
+        os.remove(fp.name)
     if remove:
         for path in path_lst:
             os.remove(path)
@@ -27,9 +145,9 @@ async def combine(path_lst: List[Path], output_path: Path, remove=True):
     for path in path_lst:
         cmd.extend(['-i', str(path)])
     # for flac, use -strict -2
-    cmd.extend(['-c', 'copy', '-strict', '-2', '-loglevel', 'quiet', str(output_path)])
+    cmd.extend(['-c', 'copy', '-strict', '-2', '-loglevel', 'error', str(output_path)])
     # print(' '.join(map(lambda x: f'"{x}"', cmd)))
-    await run_process(cmd)
+    await pool.run(cmd, priority=PRIORITY_MERGE)
     if remove:
         for path in path_lst:
             os.remove(path)
@@ -38,8 +156,21 @@ async def combine(path_lst: List[Path], output_path: Path, remove=True):
 async def time_range_clip(input_path: Path, start: int, t: int, output_path: Path, remove=True):
     # for flac, use -strict -2
     cmd = ['ffmpeg', '-ss', f'{start:.1f}', '-t', f'{t:.1f}', '-i', str(input_path), '-codec', 'copy', '-strict', '-2',
-           '-loglevel', 'quiet', '-f', 'mp4', str(output_path)]
+           '-loglevel', 'error', '-f', 'mp4', str(output_path)]
     # print(' '.join(map(lambda x: f'"{x}"', cmd)))
-    await run_process(cmd)
+    await pool.run(cmd, priority=PRIORITY_CLIP)
     if remove:
         os.remove(input_path)
+
+
+async def mux(path_lst: List[Path], output_path: Path, started: asyncio.Event = None):
+    """
+    combine inputs which are written while ffmpeg reads them (fifos). not bounded by pool, since it lasts as long as
+    the download and only copies packets at download speed, holding a worker would starve merges.
+    started is set once ffmpeg is running, writers of fifos should wait for it.
+    """
+    cmd = ['ffmpeg']
+    for path in path_lst:
+        cmd.extend(['-i', str(path)])
+    cmd.extend(['-c', 'copy', '-strict', '-2', '-loglevel', 'error', str(output_path)])
+    await pool.run(cmd, bounded=False, started=started)
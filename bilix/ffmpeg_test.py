@@ -0,0 +1,47 @@
+import asyncio
+import sys
+import pytest
+from bilix.exception import FFmpegError
+from bilix.ffmpeg import FFmpegPool, PRIORITY_MERGE, PRIORITY_CLIP
+
+
+def cmd(name: str, code: int = 0):
+    return [sys.executable, '-c', f'import sys, time; time.sleep(.05); sys.stderr.write("{name}"); sys.exit({code})']
+
+
+@pytest.mark.asyncio
+async def test_pool_priority():
+    pool = FFmpegPool(max_workers=1)
+    first = asyncio.create_task(pool.run(cmd('first')))
+    await asyncio.sleep(0)
+    assert pool.running == 1
+    # queued clips wait for the merge queued after them
+    jobs = [pool.run(cmd(f'clip{i}'), priority=PRIORITY_CLIP) for i in range(2)] + \
+           [pool.run(cmd('merge'), priority=PRIORITY_MERGE)]
+    await asyncio.gather(first, *jobs)
+    assert [job.stderr for job in pool.history] == ['first', 'merge', 'clip0', 'clip1']
+    assert all(job.run > 0 for job in pool.history)
+    assert pool.history[-1].wait >= sum(job.run for job in list(pool.history)[1:-1])
+    assert pool.running == pool.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_max_workers():
+    pool = FFmpegPool(max_workers=2)
+    tasks = [asyncio.create_task(pool.run(cmd(str(i)))) for i in range(5)]
+    await asyncio.sleep(0)
+    assert pool.running == 2 and pool.pending == 3
+    tasks[-1].cancel()  # cancelled waiters are skipped
+    pool.max_workers = 4
+    assert pool.running == 4 and pool.pending == 0
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert pool.running == 0 and len(pool.history) == 4
+
+
+@pytest.mark.asyncio
+async def test_pool_error():
+    pool = FFmpegPool()
+    with pytest.raises(FFmpegError, match='code 3: broken'):
+        await pool.run(cmd('broken', code=3))
+    assert pool.history[0].returncode == 3
+    assert pool.running == 0
@@ -0,0 +1,93 @@
+"""
+batched progress accounting for the per-chunk hot loop of downloaders
+"""
+import asyncio
+import math
+import time
+from typing import Callable, Dict, Optional
+
+from bilix.progress.abc import Progress
+
+__all__ = ['SpeedMeter', 'ProgressAccount']
+
+
+class SpeedMeter:
+    """O(1) aggregate speed estimator, exponentially weighted moving average of bytes per second"""
+
+    def __init__(self, tau: float = 1., min_interval: float = .1):
+        """
+
+        :param tau: time constant (s) of the moving average
+        :param min_interval: bytes are folded into the average at most once per min_interval
+        """
+        self.tau = tau
+        self.min_interval = min_interval
+        self._bytes = 0
+        self._last = time.monotonic()
+        self._speed = 0.
+
+    def add(self, size: int):
+        self._bytes += size
+
+    @property
+    def speed(self) -> float:
+        """current speed (Byte/s)"""
+        now = time.monotonic()
+        if (dt := now - self._last) >= self.min_interval:
+            w = math.exp(-dt / self.tau)
+            self._speed = self._speed * w + self._bytes / dt * (1 - w)
+            self._bytes = 0
+            self._last = now
+        return self._speed
+
+
+class ProgressAccount:
+    """
+    Collect advanced bytes of progress tasks locally and flush them to progress every interval,
+    so that per-chunk cost is a few integer adds instead of awaiting progress update.
+    """
+
+    def __init__(self, progress: Progress, interval: float = .1, feed: Callable[[int], None] = None):
+        """
+
+        :param progress: progress obj to flush to
+        :param interval: flush interval (s)
+        :param feed: called with bytes accounted since last flush, on every flush
+        """
+        self.progress = progress
+        self.interval = interval
+        self.feed = feed
+        self.meter = SpeedMeter(min_interval=interval)
+        self._pending: Dict[object, int] = {}
+        self._bytes = 0
+        self._next = time.monotonic() + interval
+        self._flushing: Optional[asyncio.Future] = None
+
+    def advance(self, task_id, size: int):
+        """account size bytes of task_id, must be called in event loop"""
+        self._pending[task_id] = self._pending.get(task_id, 0) + size
+        self._bytes += size
+        if self._flushing is None and time.monotonic() >= self._next:
+            self._flushing = asyncio.ensure_future(self.flush())
+            self._flushing.add_done_callback(self._flush_done)
+
+    def _flush_done(self, fut: asyncio.Future):
+        self._flushing = None
+        if not fut.cancelled():
+            fut.exception()  # progress error should not break download, retrieve it to avoid warning
+
+    async def flush(self):
+        """flush all pending bytes to progress, call it before a task is finished"""
+        self._next = time.monotonic() + self.interval
+        pending, self._pending = self._pending, {}
+        size, self._bytes = self._bytes, 0
+        self.meter.add(size)
+        if self.feed:
+            self.feed(size)
+        for task_id, advance in pending.items():
+            await self.progress.update(task_id, advance=advance)
+
+    @property
+    def speed(self) -> float:
+        """aggregate speed (Byte/s) of all tasks"""
+        return self.meter.speed
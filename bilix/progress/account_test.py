@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from bilix.progress.account import ProgressAccount
+from bilix.progress.cli_progress import CLIProgress
+
+
+@pytest.mark.asyncio
+async def test_progress_account():
+    progress = CLIProgress()
+    fed = []
+    account = ProgressAccount(progress, interval=.05, feed=fed.append)
+    task_id = await progress.add_task(description='test', total=1000)
+    for _ in range(10):
+        account.advance(task_id, 10)
+    # batched, nothing flushed yet
+    assert progress.tasks[task_id].completed == 0
+    await asyncio.sleep(.06)
+    account.advance(task_id, 10)
+    await asyncio.sleep(0)  # scheduled flush
+    assert progress.tasks[task_id].completed == 110
+    account.advance(task_id, 890)
+    await account.flush()
+    assert progress.tasks[task_id].completed == 1000
+    assert sum(fed) == 1000
+    await asyncio.sleep(.1)
+    assert account.speed > 0
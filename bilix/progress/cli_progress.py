@@ -1,4 +1,5 @@
 from bilix.progress.abc import Progress
+from bilix.progress.account import SpeedMeter
 from typing import Optional, Any, Set
 from rich.theme import Theme
 from rich.style import Style
@@ -40,6 +41,7 @@ class CLIProgress(Progress):
 
     def __init__(self):
         self._active_ids: Set[TaskID] = set()
+        self._meter = SpeedMeter()
 
     @classmethod
     def start(cls):
@@ -74,8 +76,7 @@ class CLIProgress(Progress):
 
     @property
     def active_speed(self):
-        return sum(self._progress.tasks[task_id].speed for task_id in self._active_ids
-                   if self._progress.tasks[task_id].speed)
+        return self._meter.speed
 
     async def update(
             self,
@@ -91,6 +92,8 @@ class CLIProgress(Progress):
     ) -> None:
         if description:
             description = self._cat_description(description)
+        if advance:
+            self._meter.add(advance)
         self._progress.update(task_id, total=total, completed=completed, advance=advance,
                               description=description, visible=visible, refresh=refresh, **fields)
         if self._progress.tasks[task_id].finished and task_id in self._active_ids:
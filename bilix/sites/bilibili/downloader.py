@@ -11,6 +11,7 @@ from bilix.download.base_downloader_part import BaseDownloaderPart
 from bilix._process import SingletonPPE
 from bilix.utils import legal_title, cors_slice, valid_sess_data, t2s, json2srt
 from bilix.download.utils import req_retry, path_check
+from bilix.download.client_pool import get_client
 from bilix.exception import HandleMethodError, APIUnsupportedError, APIResourceError, APIError
 from bilix.cli.assign import kwargs_filter, auto_assemble
 from bilix import ffmpeg
@@ -31,7 +32,9 @@ class DownloaderBilibili(BaseDownloaderPart):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
+            stream_mux: bool = False,
             # unique params
             sess_data: str = None,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
@@ -45,12 +48,14 @@ class DownloaderBilibili(BaseDownloaderPart):
         :param stream_retry:
         :param progress:
         :param logger:
+        :param adaptive: 根据吞吐量自动调整并发数
         :param sess_data: bilibili SESSDATA cookie
         :param part_concurrency: 媒体分段并发数
+        :param stream_mux: 边下载边通过管道合并音视频，不保留中间文件（不支持断点续传）
         :param video_concurrency: 视频并发数
         :param hierarchy: 是否使用层级目录
         """
-        client = client or httpx.AsyncClient(**api.dft_client_settings)
+        client = client or get_client(**api.dft_client_settings)
         super(DownloaderBilibili, self).__init__(
             client=client,
             browser=browser,
@@ -58,11 +63,13 @@ class DownloaderBilibili(BaseDownloaderPart):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
+            stream_mux=stream_mux,
         )
         client.cookies.set('SESSDATA', valid_sess_data(sess_data))
         self._cate_meta = None
-        self.v_sema = asyncio.Semaphore(video_concurrency)
+        self.v_sema = self._concurrency_sema('video', video_concurrency)
         self.api_sema = asyncio.Semaphore(video_concurrency)
         self.hierarchy = hierarchy
         self.title_overflow = 50
@@ -335,6 +342,10 @@ class DownloaderBilibili(BaseDownloaderPart):
                     video_info = await api.get_video_info(self.client, url)
                 except (APIResourceError, APIUnsupportedError) as e:
                     return self.logger.warning(e)
+            if video_info.dash:
+                self._prewarm(m.base_url for m in video_info.dash.videos + video_info.dash.audios)
+            elif video_info.other:
+                self._prewarm(m.base_url for m in video_info.other)
             p_name = legal_title(video_info.pages[video_info.p].p_name)
             task_name = legal_title(video_info.title, p_name)
             # if title is too long, use p_name as base_name
@@ -359,6 +370,9 @@ class DownloaderBilibili(BaseDownloaderPart):
                         exists, media_path = path_check(path / f'{media_name}.mp4')
                         if exists:
                             self.logger.info(f'[green]已存在[/green] {media_path.name}')
+                        elif self.stream_mux and not time_range:
+                            media_cors.append(self.get_muxed([video.urls, audio.urls], media_path, task_id=task_id,
+                                                             sizes=[video.size, audio.size]))
                         else:
                             tmp.append((video, path / f'{media_name}-v'))
                             tmp.append((audio, path / f'{media_name}-a'))
@@ -371,7 +385,8 @@ class DownloaderBilibili(BaseDownloaderPart):
                         self.logger.warning(f"No audio for {task_name}")
                     # convert to coroutines
                     if not time_range:
-                        media_cors.extend(self.get_file(t[0].urls, path=t[1], task_id=task_id) for t in tmp)
+                        media_cors.extend(self.get_file(t[0].urls, path=t[1], task_id=task_id, size=t[0].size)
+                                          for t in tmp)
                     else:
                         if len(tmp) > 0:
                             fut = asyncio.Future()  # to fix key frame
@@ -396,7 +411,7 @@ class DownloaderBilibili(BaseDownloaderPart):
                 if len(video_info.other) == 1:
                     m = video_info.other[0]
                     media_cors.append(
-                        self.get_file(m.urls, path=path / f'{media_name}.{m.suffix}', task_id=task_id))
+                        self.get_file(m.urls, path=path / f'{media_name}.{m.suffix}', task_id=task_id, size=m.size))
                 else:
                     exist, media_path = path_check(path / f'{media_name}.mp4')
                     if exist:
@@ -406,7 +421,7 @@ class DownloaderBilibili(BaseDownloaderPart):
 
                         async def _get_file(media: api.Media, p: Path) -> Path:
                             async with p_sema:
-                                return await self.get_file(media.urls, path=p, task_id=task_id)
+                                return await self.get_file(media.urls, path=p, task_id=task_id, size=media.size)
 
                         for i, m in enumerate(video_info.other):
                             f = f'{media_name}-{i}.{m.suffix}'
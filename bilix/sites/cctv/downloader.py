@@ -6,6 +6,7 @@ import httpx
 
 from . import api
 from bilix.download.base_downloader_m3u8 import BaseDownloaderM3u8
+from bilix.download.client_pool import get_client
 
 
 class DownloaderCctv(BaseDownloaderM3u8):
@@ -20,12 +21,13 @@ class DownloaderCctv(BaseDownloaderM3u8):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
             # unique params
             hierarchy: bool = True,
     ):
-        client = client or httpx.AsyncClient(**api.dft_client_settings)
+        client = client or get_client(**api.dft_client_settings)
         super(DownloaderCctv, self).__init__(
             client=client,
             browser=browser,
@@ -33,6 +35,7 @@ class DownloaderCctv(BaseDownloaderM3u8):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
             video_concurrency=video_concurrency,
         )
@@ -5,6 +5,7 @@ from typing import Union, Tuple
 import httpx
 from . import api
 from bilix.download.base_downloader_m3u8 import BaseDownloaderM3u8
+from bilix.download.client_pool import get_client
 
 
 class DownloaderJable(BaseDownloaderM3u8):
@@ -19,13 +20,14 @@ class DownloaderJable(BaseDownloaderM3u8):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
             # unique params
             hierarchy: bool = True,
 
     ):
-        client = client or httpx.AsyncClient(**api.dft_client_settings)
+        client = client or get_client(**api.dft_client_settings)
         super(DownloaderJable, self).__init__(
             client=client,
             browser=browser,
@@ -33,33 +35,37 @@ class DownloaderJable(BaseDownloaderM3u8):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
             video_concurrency=video_concurrency,
         )
         self.hierarchy = hierarchy
 
-    async def get_actor(self, url: str, path=Path("."), image=True):
+    async def get_actor(self, url: str, path=Path("."), image=True, quality: Union[int, str] = 0):
         """
         download videos of a actor
         :cli: short: a
         :param url: actor page url
         :param path: save path
         :param image: download cover
+        :param quality: variant of m3u8
         :return:
         """
         data = await api.get_actor_info(self.client, url)
         if self.hierarchy:
             path /= data['actor_name']
             path.mkdir(parents=True, exist_ok=True)
-        await asyncio.gather(*[self.get_video(url, path, image) for url in data['urls']])
+        await asyncio.gather(*[self.get_video(url, path, image, quality=quality) for url in data['urls']])
 
-    async def get_video(self, url: str, path=Path("."), image=True, time_range: Tuple[int, int] = None):
+    async def get_video(self, url: str, path=Path("."), image=True, time_range: Tuple[int, int] = None,
+                        quality: Union[int, str] = 0):
         """
         :cli: short: v
         :param url:
         :param path:
         :param image:
         :param time_range:
+        :param quality:
         :return:
         """
         video_info = await api.get_video_info(self.client, url)
@@ -67,7 +73,7 @@ class DownloaderJable(BaseDownloaderM3u8):
             path /= f"{video_info.avid} {video_info.actor_name}"
             path.mkdir(parents=True, exist_ok=True)
         cors = [self.get_m3u8_video(m3u8_url=video_info.m3u8_url, path=path / f"{video_info.title}.mp4",
-                                    time_range=time_range)]
+                                    time_range=time_range, quality=quality)]
         if image:
             cors.append(self.get_static(video_info.img_url, path=path / video_info.title, ))
         await asyncio.gather(*cors)
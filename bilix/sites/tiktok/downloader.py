@@ -5,6 +5,7 @@ from typing import Union
 import httpx
 from . import api
 from bilix.download.base_downloader_part import BaseDownloaderPart
+from bilix.download.client_pool import get_client
 from bilix.utils import legal_title
 
 
@@ -20,9 +21,10 @@ class DownloaderTiktok(BaseDownloaderPart):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
     ):
-        client = client or httpx.AsyncClient(**api.dft_client_settings)
+        client = client or get_client(**api.dft_client_settings)
         super(DownloaderTiktok, self).__init__(
             client=client,
             browser=browser,
@@ -30,6 +32,7 @@ class DownloaderTiktok(BaseDownloaderPart):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
         )
 
@@ -42,6 +45,7 @@ class DownloaderTiktok(BaseDownloaderPart):
         :return:
         """
         video_info = await api.get_video_info(self.client, url)
+        self._prewarm(video_info.nwm_urls[:1])
         title = legal_title(video_info.author_name, video_info.title)
         # since TikTok backup not fast enough some time, use the first one
         cors = [self.get_file(video_info.nwm_urls[0], path / f'{title}.mp4')]
@@ -5,6 +5,7 @@ from typing import Sequence, Union, Tuple
 from . import api
 from bilix.utils import legal_title, cors_slice
 from bilix.download.base_downloader_m3u8 import BaseDownloaderM3u8
+from bilix.download.client_pool import get_client
 
 
 class DownloaderYhdmp(BaseDownloaderM3u8):
@@ -18,11 +19,12 @@ class DownloaderYhdmp(BaseDownloaderM3u8):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
             hierarchy: bool = True,
     ):
-        stream_client = stream_client or httpx.AsyncClient()
+        stream_client = stream_client or get_client()
         super(DownloaderYhdmp, self).__init__(
             client=stream_client,
             browser=browser,
@@ -30,18 +32,28 @@ class DownloaderYhdmp(BaseDownloaderM3u8):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
             video_concurrency=video_concurrency,
         )
-        self.api_client = api_client or httpx.AsyncClient(**api.dft_client_settings)
+        self.api_client = api_client or get_client(**api.dft_client_settings)
         self.hierarchy = hierarchy
 
-    async def get_series(self, url: str, path=Path('.'), p_range: Sequence[int] = None):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await super().__aexit__(exc_type, exc_val, exc_tb)
+        await self.api_client.aclose()
+
+    async def aclose(self):
+        await super().aclose()
+        await self.api_client.aclose()
+
+    async def get_series(self, url: str, path=Path('.'), p_range: Sequence[int] = None, quality: Union[int, str] = 0):
         """
         :cli: short: s
         :param url:
         :param path:
         :param p_range:
+        :param quality:
         :return:
         """
         video_info = await api.get_video_info(self.api_client, url)
@@ -55,30 +67,32 @@ class DownloaderYhdmp(BaseDownloaderM3u8):
         # no need to reuse get_video since we only need m3u8_url
         async def get_video(page_url, name):
             m3u8_url = await api.get_m3u8_url(self.api_client, page_url)
-            await self.get_m3u8_video(m3u8_url=m3u8_url, path=path / name)
+            await self.get_m3u8_video(m3u8_url=m3u8_url, path=path / name, quality=quality)
 
         cors = []
         for idx, (sub_title, url) in enumerate(video_info.play_info[play_idx]):
             if ep_idx == idx:
                 cors.append(self.get_m3u8_video(m3u8_url=video_info.m3u8_url,
-                                                path=path / f'{legal_title(title, sub_title)}.mp4'))
+                                                path=path / f'{legal_title(title, sub_title)}.mp4', quality=quality))
             else:
                 cors.append(get_video(url, legal_title(title, sub_title)))
         if p_range:
             cors = cors_slice(cors, p_range)
         await asyncio.gather(*cors)
 
-    async def get_video(self, url: str, path=Path('.'), time_range=None):
+    async def get_video(self, url: str, path=Path('.'), time_range=None, quality: Union[int, str] = 0):
         """
         :cli: short: v
         :param url:
         :param path:
         :param time_range:
+        :param quality:
         :return:
         """
         video_info = await api.get_video_info(self.api_client, url)
         name = legal_title(video_info.title, video_info.sub_title)
-        await self.get_m3u8_video(m3u8_url=video_info.m3u8_url, path=path / f'{name}.mp4', time_range=time_range)
+        await self.get_m3u8_video(m3u8_url=video_info.m3u8_url, path=path / f'{name}.mp4', time_range=time_range,
+                                  quality=quality)
 
     @classmethod
     def _decide_handle(cls, method: str, keys: Tuple[str, ...], options: dict) -> bool:
@@ -7,6 +7,7 @@ from typing import Sequence, Union, Tuple
 from . import api
 from bilix.utils import legal_title, cors_slice
 from bilix.download.base_downloader_m3u8 import BaseDownloaderM3u8
+from bilix.download.client_pool import get_client
 from bilix.exception import APIError
 
 
@@ -21,11 +22,12 @@ class DownloaderYinghuacd(BaseDownloaderM3u8):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
             video_concurrency: Union[int, asyncio.Semaphore] = 3,
             hierarchy: bool = True,
     ):
-        stream_client = stream_client or httpx.AsyncClient()
+        stream_client = stream_client or get_client()
         super(DownloaderYinghuacd, self).__init__(
             client=stream_client,
             browser=browser,
@@ -33,43 +35,55 @@ class DownloaderYinghuacd(BaseDownloaderM3u8):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
+            adaptive=adaptive,
             part_concurrency=part_concurrency,
             video_concurrency=video_concurrency,
         )
-        self.api_client = api_client or httpx.AsyncClient(**api.dft_client_settings)
+        self.api_client = api_client or get_client(**api.dft_client_settings)
         self.hierarchy = hierarchy
 
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await super().__aexit__(exc_type, exc_val, exc_tb)
+        await self.api_client.aclose()
+
+    async def aclose(self):
+        await super().aclose()
+        await self.api_client.aclose()
+
     def _after_seg(self, seg: Segment, content: bytearray) -> bytearray:
         # in case .png
         if re.fullmatch(r'.*\.png', seg.absolute_uri):
             _, _, content = content.partition(b'\x47\x40')
         return content
 
-    async def get_series(self, url: str, path=Path("."), p_range: Sequence[int] = None):
+    async def get_series(self, url: str, path=Path("."), p_range: Sequence[int] = None, quality: Union[int, str] = 0):
         """
         :cli: short: s
         :param url:
         :param path:
         :param p_range:
+        :param quality:
         :return:
         """
         video_info = await api.get_video_info(self.api_client, url)
         if self.hierarchy:
             path /= video_info.title
             path.mkdir(parents=True, exist_ok=True)
-        cors = [self.get_video(u, path=path, video_info=video_info if u == url else None)
+        cors = [self.get_video(u, path=path, video_info=video_info if u == url else None, quality=quality)
                 for _, u in video_info.play_info]
         if p_range:
             cors = cors_slice(cors, p_range)
         await asyncio.gather(*cors)
 
-    async def get_video(self, url: str, path=Path('.'), time_range=None, video_info=None):
+    async def get_video(self, url: str, path=Path('.'), time_range=None, video_info=None,
+                        quality: Union[int, str] = 0):
         """
         :cli: short: v
         :param url:
         :param path:
         :param time_range:
         :param video_info:
+        :param quality:
         :return:
         """
         if video_info is None:
@@ -80,7 +94,8 @@ class DownloaderYinghuacd(BaseDownloaderM3u8):
         else:
             video_info = video_info
         name = legal_title(video_info.title, video_info.sub_title)
-        await self.get_m3u8_video(m3u8_url=video_info.m3u8_url, path=path / f'{name}.mp4', time_range=time_range)
+        await self.get_m3u8_video(m3u8_url=video_info.m3u8_url, path=path / f'{name}.mp4', time_range=time_range,
+                                  quality=quality)
 
     @classmethod
     def _decide_handle(cls, method: str, keys: Tuple[str, ...], options: dict):
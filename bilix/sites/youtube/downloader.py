@@ -5,6 +5,7 @@ from typing import Union
 import httpx
 from . import api
 from bilix.download.base_downloader_part import BaseDownloaderPart
+from bilix.download.client_pool import get_client
 from bilix import ffmpeg
 
 
@@ -20,11 +21,13 @@ class DownloaderYoutube(BaseDownloaderPart):
             stream_retry: int = 5,
             progress=None,
             logger=None,
+            adaptive: bool = False,
             part_concurrency: int = 10,
+            stream_mux: bool = False,
             # unique params
             video_concurrency: Union[int, asyncio.Semaphore] = 3
     ):
-        client = client or httpx.AsyncClient(**api.dft_client_settings)
+        client = client or get_client(**api.dft_client_settings)
         super(DownloaderYoutube, self).__init__(
             client=client,
             browser=browser,
@@ -32,9 +35,11 @@ class DownloaderYoutube(BaseDownloaderPart):
             stream_retry=stream_retry,
             progress=progress,
             logger=logger,
-            part_concurrency=part_concurrency
+            adaptive=adaptive,
+            part_concurrency=part_concurrency,
+            stream_mux=stream_mux,
         )
-        self.video_sema = asyncio.Semaphore(video_concurrency) if type(video_concurrency) is int else video_concurrency
+        self.video_sema = self._concurrency_sema('video', video_concurrency)
 
     async def get_video(self, url: str, path=Path('.')):
         """
@@ -45,14 +50,21 @@ class DownloaderYoutube(BaseDownloaderPart):
         """
         async with self.video_sema:
             video_info = await api.get_video_info(self.client, url)
+            self._prewarm([video_info.video_url, video_info.audio_url])
             video_path = path / (video_info.title + '.mp4')
             if video_path.exists():
                 return self.logger.info(f'[green]已存在[/green] {video_path.name}')
             task_id = await self.progress.add_task(description=video_info.title, upper=True)
-            path_lst = await asyncio.gather(
-                self.get_file(url_or_urls=video_info.video_url, path=path / (video_info.title + '-v'), task_id=task_id),
-                self.get_file(url_or_urls=video_info.audio_url, path=path / (video_info.title + '-a'), task_id=task_id)
-            )
-        await ffmpeg.combine(path_lst, output_path=path / (video_info.title + '.mp4'))
+            if self.stream_mux:
+                await self.get_muxed([video_info.video_url, video_info.audio_url], video_path, task_id=task_id)
+            else:
+                path_lst = await asyncio.gather(
+                    self.get_file(url_or_urls=video_info.video_url, path=path / (video_info.title + '-v'),
+                                  task_id=task_id),
+                    self.get_file(url_or_urls=video_info.audio_url, path=path / (video_info.title + '-a'),
+                                  task_id=task_id)
+                )
+        if not self.stream_mux:
+            await ffmpeg.combine(path_lst, output_path=video_path)
         self.logger.info(f'[cyan]已完成[/cyan] {video_path.name}')
         await self.progress.update(task_id=task_id, visible=False)
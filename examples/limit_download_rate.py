@@ -5,6 +5,7 @@ limit download rate is simple
 import asyncio
 from bilix.sites.bilibili import DownloaderBilibili
 from bilix.sites.cctv import DownloaderCctv
+from bilix.download.rate_limit import TokenBucket
 
 
 async def main():
@@ -22,5 +23,16 @@ async def main2():
         )
 
 
+async def main3():
+    # 多个downloader也可以共享同一个限速器，总速度限制在2MB/s
+    # downloaders can also share one rate limiter, total speed is limited to 2MB/s
+    bucket = TokenBucket(2e6)
+    async with DownloaderBilibili(speed_limit=bucket) as bili_d, DownloaderCctv(speed_limit=bucket) as cctv_d:
+        await asyncio.gather(
+            bili_d.get_series('https://www.bilibili.com/video/BV1cd4y1Z7EG'),
+            cctv_d.get_series('https://tv.cctv.com/2012/05/02/VIDE1355968282695723.shtml')
+        )
+
+
 if __name__ == '__main__':
     asyncio.run(main())